@@ -168,6 +168,7 @@ SUPPLIER_DATA = {
 # Mapeamentos simplificados para consulta rápida
 SUPPLIER_MAP = {k: v["nome"] for k, v in SUPPLIER_DATA.items()}
 SUPPLIER_CODE_MAP = {v: k for k, v in SUPPLIER_MAP.items()}
+SUPPLIER_NAMES = frozenset(SUPPLIER_MAP.values())
 MARKUP_MAP = {k: v["marcacao"] for k, v in SUPPLIER_DATA.items() if v["marcacao"] is not None}
 
 def get_color_name(color_code):
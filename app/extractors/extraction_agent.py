@@ -390,9 +390,14 @@ class ExtractionAgent:
                         
                         # Calcular total_price se não existir
                         if "total_price" not in product or product["total_price"] is None:
-                            subtotals = [color.get("subtotal", 0) for color in product["colors"] 
-                                        if color.get("subtotal") is not None]
-                            product["total_price"] = sum(subtotals) if subtotals else None
+                            total_price = 0
+                            found = False
+                            for color in product["colors"]:
+                                subtotal = color.get("subtotal")
+                                if subtotal is not None:
+                                    total_price += subtotal
+                                    found = True
+                            product["total_price"] = total_price if found else None
                         else:
                             # Garantir que é um número
                             try:
@@ -1,5 +1,6 @@
 # app/extractors/gemini_extractor.py
 import os
+import asyncio
 import json
 import logging
 import time
@@ -96,8 +97,8 @@ class GeminiExtractor(BaseExtractor):
             jobs_store[job_id]["model_results"]["gemini"]["progress"] = 15.0
             
             if is_pdf:
-                # Converter todas as páginas para imagens
-                image_paths = convert_pdf_to_images(document_path, CONVERTED_DIR)
+                # Converter todas as páginas para imagens, fora do event loop
+                image_paths = await asyncio.to_thread(convert_pdf_to_images, document_path, CONVERTED_DIR)
             else:
                 image_paths = [document_path]
                 
@@ -375,9 +376,14 @@ class GeminiExtractor(BaseExtractor):
                                     existing_color_codes.add(color_code)
                             
                             # Recalcular total_price
-                            subtotals = [color.get("subtotal", 0) for color in existing_product["colors"] 
-                                        if color.get("subtotal") is not None]
-                            existing_product["total_price"] = sum(subtotals) if subtotals else None
+                            total_price = 0
+                            found = False
+                            for color in existing_product["colors"]:
+                                subtotal = color.get("subtotal")
+                                if subtotal is not None:
+                                    total_price += subtotal
+                                    found = True
+                            existing_product["total_price"] = total_price if found else None
                             
                             break
                 else:
@@ -2,6 +2,8 @@
 import os
 import json
 import logging
+import threading
+import time
 import uuid
 from datetime import datetime
 from typing import Dict, Any, List, Optional
@@ -10,12 +12,49 @@ from app.extractors.base import BaseExtractor
 
 logger = logging.getLogger(__name__)
 
+# Estado do gerador de UUIDv7 (milissegundo e sequência do último ID)
+_uuid7_lock = threading.Lock()
+_uuid7_last_ms = 0
+_uuid7_seq = 0
+
+def uuid7() -> uuid.UUID:
+    """
+    Gera um UUID versão 7: ordenado pelo tempo (timestamp Unix em ms nos
+    48 bits mais significativos) e monotónico dentro do mesmo processo.
+    
+    A parte aleatória continua a vir de os.urandom, para que os IDs dos jobs
+    (usados para obter resultados) não sejam previsíveis.
+    
+    Returns:
+        uuid.UUID: Novo UUID
+    """
+    global _uuid7_last_ms, _uuid7_seq
+    
+    with _uuid7_lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _uuid7_last_ms:
+            _uuid7_last_ms, _uuid7_seq = ms, 0
+        else:
+            # Mesmo milissegundo (ou relógio recuou): incrementar a sequência de 12 bits
+            _uuid7_seq += 1
+            if _uuid7_seq > 0xFFF:
+                _uuid7_last_ms, _uuid7_seq = _uuid7_last_ms + 1, 0
+        ms, seq = _uuid7_last_ms, _uuid7_seq
+    
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (ms << 80) | (0x7 << 76) | (seq << 64) | (0b10 << 62) | rand_b
+    return uuid.UUID(int=value)
+
 class JobService:
     """Serviço para gerenciamento de jobs de processamento"""
     
     def __init__(self):
         """Inicializa o serviço de jobs"""
-        self.jobs = {} 
+        self.jobs = {}
+        # Protege a inserção/iteração de entradas em self.jobs
+        self._jobs_lock = threading.Lock()
+        # Um lock por job, para que atualizações de jobs distintos não se bloqueiem
+        self._job_locks: Dict[str, threading.RLock] = {}
     
     def create_job(self, file_path: str, filename: str, job_id: Optional[str] = None) -> str:
         """
@@ -24,15 +63,15 @@ class JobService:
         Args:
             file_path: Caminho do arquivo
             filename: Nome do arquivo
-            job_id: ID opcional do job (se não fornecido, será gerado um UUID)
+            job_id: ID opcional do job (se não fornecido, será gerado um UUIDv7)
             
         Returns:
             str: ID do job criado
         """
         if not job_id:
-            job_id = str(uuid.uuid4())
+            job_id = str(uuid7())
         
-        self.jobs[job_id] = {
+        job = {
             "job_id": job_id,
             "status": "processing",
             "progress": 0.0,
@@ -42,6 +81,10 @@ class JobService:
             "model_results": {},
         }
         
+        with self._jobs_lock:
+            self._job_locks[job_id] = threading.RLock()
+            self.jobs[job_id] = job
+        
         return job_id
     
     def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
@@ -63,6 +106,9 @@ class JobService:
         Returns:
             Dict: Dicionário com todos os jobs
         """
+        with self._jobs_lock:
+            jobs = list(self.jobs.items())
+        
         return {
             job_id: {
                 "status": job["status"],
@@ -71,30 +117,33 @@ class JobService:
                 "created_at": job["created_at"],
                 "models_used": list(job["model_results"].keys()),
             }
-            for job_id, job in self.jobs.items()
+            for job_id, job in jobs
         }
     
     def update_job_progress(self, job_id: str) -> None:
-            """
-            Atualiza o progresso geral do job com base nos resultados dos modelos
-            
-            Args:
-                job_id: ID do job a ser atualizado
-            """
-            if job_id not in self.jobs:
-                logger.warning(f"Tentativa de atualizar job inexistente: {job_id}")
-                return
-                
-            job = self.jobs[job_id]
-            model_results = job["model_results"]
+        """
+        Atualiza o progresso geral do job com base nos resultados dos modelos
+        
+        Args:
+            job_id: ID do job a ser atualizado
+        """
+        job = self.jobs.get(job_id)
+        job_lock = self._job_locks.get(job_id)
+        if job is None or job_lock is None:
+            logger.warning(f"Tentativa de atualizar job inexistente: {job_id}")
+            return
+        
+        # Apenas o lock deste job, para não serializar atualizações de outros jobs
+        with job_lock:
+            model_results = list(job["model_results"].values())
             
             # Calcular progresso geral - média dos progressos dos modelos
-            total_progress = sum(mr.get("progress", 0) for mr in model_results.values())
+            total_progress = sum(mr.get("progress", 0) for mr in model_results)
             if len(model_results) > 0:
                 job["progress"] = total_progress / len(model_results)
             
             # Verificar se todos os modelos foram processados
-            all_completed = all(mr.get("status") in ["completed", "failed"] for mr in model_results.values())
+            all_completed = all(mr.get("status") in ["completed", "failed"] for mr in model_results)
             
             if all_completed:
-                job["status"] = "completed"
\ No newline at end of file
+                job["status"] = "completed"
@@ -1,70 +1,107 @@
 # app/services/reference_service.py
-import os
-import json
 import logging
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, List, Optional
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Callable
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+try:
+    import xlsxwriter  # noqa: F401
+    has_xlsxwriter = True
+except ImportError:
+    has_xlsxwriter = False
+    logger.warning("xlsxwriter não encontrado, exportação Excel via openpyxl")
+
+try:
+    import orjson
+    has_orjson = True
+except ImportError:
+    has_orjson = False
+
+# Colunas da tabela de referências, pela ordem de exportação
+_EXCEL_COLUMNS: Tuple[str, ...] = (
+    "Referência", "Referência Base", "Contador", "Nome", "Modelo", "Categoria",
+    "Cor-Código", "Cor-Nome", "Tamanho", "Quantidade", "Preço Custo",
+    "Preço de Venda", "Composição", "Descrição", "Marca", "Fornecedor",
+    "Pedido", "Data", "Temporada"
+)
+
 class ReferenceService:
     """Serviço para geração de referências de produtos"""
     
     def __init__(self):
         """Inicializa o serviço de referências"""
-        pass
+        # Diretórios de saída já criados/verificados
+        self._known_dirs: set[str] = set()
     
-    def generate_references(self, extraction_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _ensure_parent_dir(self, output_path: str) -> None:
         """
-        Gera referências sequenciais para produtos com base no código do material.
+        Cria o diretório do arquivo de saída, apenas na primeira vez que é usado
+        
+        Args:
+            output_path: Caminho do arquivo de saída
+        """
+        parent = Path(output_path).parent
+        key = str(parent)
+        if key not in self._known_dirs:
+            parent.mkdir(parents=True, exist_ok=True)
+            self._known_dirs.add(key)
+    
+    def _write_output(self, output_path: str, write: Callable[[], None]) -> None:
+        """
+        Executa a escrita de um arquivo garantindo que o diretório existe
+        
+        Args:
+            output_path: Caminho do arquivo de saída
+            write: Função que escreve o arquivo
+        """
+        self._ensure_parent_dir(output_path)
+        try:
+            write()
+        except FileNotFoundError:
+            # O diretório pode ter sido removido entretanto (ex: serviço de limpeza)
+            self._known_dirs.discard(str(Path(output_path).parent))
+            self._ensure_parent_dir(output_path)
+            write()
+    
+    def _flatten_references(self, extraction_result: Dict[str, Any]) -> pd.DataFrame:
+        """
+        Achata o resultado da extração numa tabela colunar (uma linha por SKU).
+        
+        Os campos são recolhidos em listas paralelas numa única passagem e os
+        contadores/referências/descrições são calculados de forma vetorizada.
         
         Args:
             extraction_result: Resultado da extração do documento
             
         Returns:
-            List[Dict]: Lista de produtos com referências padronizadas
+            pd.DataFrame: Tabela com uma linha por combinação produto/cor/tamanho
         """
-        if not extraction_result or "products" not in extraction_result:
-            logger.warning("Resultado de extração vazio ou inválido")
-            return []
-        
-        # Lista para armazenar todos os itens processados
-        processed_items = []
-        
-        # Dicionário para rastrear contadores por referência base (material_code)
-        ref_counters = {}
+        # Colunas ao nível do SKU
+        mat_codes, names, models, categories, compositions, brands = [], [], [], [], [], []
+        color_codes, color_names, sizes, qtys, unit_prices, sales_prices = [], [], [], [], [], []
         
         # Informações do pedido
         order_info = extraction_result.get("order_info", {})
-        supplier = order_info.get("supplier", "")
         brand = order_info.get("brand", "")
-        order_number = order_info.get("order_number", "")
-        order_date = order_info.get("date", "")
-        season = order_info.get("season", "")
         
-        # Processar cada produto
         for product in extraction_result.get("products", []):
-            # Extrair informações do produto
             product_name = product.get("name", "")
             material_code = product.get("material_code", "")
             category = product.get("category", "")
             model = product.get("model", "")
             composition = product.get("composition", "")
-            product_brand = product.get("brand", brand)
-            
-            # Inicializar contador para este código de material se não existir
-            if material_code not in ref_counters:
-                ref_counters[material_code] = 0
+            product_brand = product.get("brand", brand) or brand
             
-            # Para cada cor do produto
             for color in product.get("colors", []):
                 color_code = color.get("color_code", "")
                 color_name = color.get("color_name", "")
                 unit_price = color.get("unit_price", 0)
                 sales_price = color.get("sales_price", 0)
                 
-                # Para cada tamanho da cor
                 for size_info in color.get("sizes", []):
                     size = size_info.get("size", "")
                     quantity = size_info.get("quantity", 0)
@@ -72,43 +109,91 @@ class ReferenceService:
                     if not size or quantity <= 0:
                         continue  # Pular tamanhos inválidos ou sem quantidade
                     
-                    # Incrementar contador para este código de material
-                    ref_counters[material_code] += 1
-                    counter = ref_counters[material_code]
-                    
-                    # Formar a referência completa no formato material_code.counter
-                    reference = f"{material_code}.{counter}"
-                    
-                    # Formar descrição do produto
-                    description = f"{product_name} - {model} [{color_name}/{size}]"
-                    
-                    # Criar item processado
-                    processed_item = {
-                        "Referência Base": material_code,
-                        "Contador": counter,
-                        "Referência": reference,
-                        "Nome": product_name,
-                        "Modelo": model,
-                        "Categoria": category,
-                        "Cor-Código": color_code,
-                        "Cor-Nome": color_name,
-                        "Tamanho": size,
-                        "Descrição": description,
-                        "Composição": composition,
-                        "Quantidade": quantity,
-                        "Preço Custo": unit_price,
-                        "Preço de Venda": sales_price,
-                        "Marca": product_brand if product_brand else brand,
-                        "Fornecedor": supplier,
-                        "Pedido": order_number,
-                        "Data": order_date,
-                        "Temporada": season
-                    }
-                    
-                    processed_items.append(processed_item)
+                    mat_codes.append(material_code)
+                    names.append(product_name)
+                    models.append(model)
+                    categories.append(category)
+                    compositions.append(composition)
+                    brands.append(product_brand)
+                    color_codes.append(color_code)
+                    color_names.append(color_name)
+                    sizes.append(size)
+                    qtys.append(quantity)
+                    unit_prices.append(unit_price)
+                    sales_prices.append(sales_price)
+        
+        base = pd.Series(mat_codes, dtype=object)
         
-        logger.info(f"Geradas {len(processed_items)} referências de produtos.")
-        return processed_items
+        # Contador sequencial por código de material (material_code.1, .2, ...)
+        counters = (base.groupby(base, dropna=False).cumcount() + 1).astype(np.int32)
+        references = base.astype(str).str.cat(counters.astype(str), sep=".")
+        
+        # Descrição no formato "Nome - Modelo [Cor/Tamanho]"
+        descriptions = (
+            pd.Series(names, dtype=object).astype(str)
+            .str.cat(pd.Series(models, dtype=object).astype(str), sep=" - ")
+            .str.cat(pd.Series(color_names, dtype=object).astype(str), sep=" [")
+            .str.cat(pd.Series(sizes, dtype=object).astype(str), sep="/")
+            + "]"
+        )
+        
+        # Construção a partir de colunas (sem transposição de uma lista de dicts),
+        # já na ordem de exportação; os campos do pedido são escalares,
+        # propagados para todas as linhas. Colunas em dtype object, para que os
+        # valores mantenham os tipos originais (None não passa a NaN, nem as
+        # quantidades inteiras a float)
+        df = pd.DataFrame({
+            "Referência": references,
+            "Referência Base": base,
+            "Contador": counters,
+            "Nome": names,
+            "Modelo": models,
+            "Categoria": categories,
+            "Cor-Código": color_codes,
+            "Cor-Nome": color_names,
+            "Tamanho": sizes,
+            "Quantidade": qtys,
+            "Preço Custo": unit_prices,
+            "Preço de Venda": sales_prices,
+            "Composição": compositions,
+            "Descrição": descriptions,
+            "Marca": brands,
+            "Fornecedor": order_info.get("supplier", ""),
+            "Pedido": order_info.get("order_number", ""),
+            "Data": order_info.get("date", ""),
+            "Temporada": order_info.get("season", ""),
+        }, columns=list(_EXCEL_COLUMNS), dtype=object, copy=False)
+        
+        logger.info(f"Geradas {len(df)} referências de produtos.")
+        return df
+    
+    def _build_dataframe(self, extraction_result: Dict[str, Any]) -> pd.DataFrame:
+        """
+        Obtém a tabela de referências do resultado da extração
+        
+        Args:
+            extraction_result: Resultado da extração do documento
+            
+        Returns:
+            pd.DataFrame: Tabela de referências (vazia se o resultado for inválido)
+        """
+        if not extraction_result or "products" not in extraction_result:
+            logger.warning("Resultado de extração vazio ou inválido")
+            return pd.DataFrame(columns=list(_EXCEL_COLUMNS))
+        
+        return self._flatten_references(extraction_result)
+    
+    def generate_references(self, extraction_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Gera referências sequenciais para produtos com base no código do material.
+        
+        Args:
+            extraction_result: Resultado da extração do documento
+            
+        Returns:
+            List[Dict]: Lista de produtos com referências padronizadas
+        """
+        return self._build_dataframe(extraction_result).to_dict(orient="records")
     
     def export_to_excel(
         self, 
@@ -125,29 +210,24 @@ class ReferenceService:
         Returns:
             str: Caminho do arquivo Excel gerado
         """
-        # Gerar referências
-        processed_items = self.generate_references(extraction_result)
-        
-        # Criar diretório de saída se não existir
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Criar DataFrame
-        df = pd.DataFrame(processed_items)
-        
-        # Reordenar colunas para melhor visualização
-        column_order = [
-            "Referência", "Referência Base", "Contador", "Nome", "Modelo", "Categoria",
-            "Cor-Código", "Cor-Nome", "Tamanho", "Quantidade", "Preço Custo", 
-            "Preço de Venda", "Composição", "Descrição", "Marca", "Fornecedor",
-            "Pedido", "Data", "Temporada"
-        ]
+        # Gerar referências diretamente como DataFrame (já na ordem de _EXCEL_COLUMNS)
+        df = self._build_dataframe(extraction_result)
         
-        # Filtrar apenas colunas existentes
-        existing_columns = [col for col in column_order if col in df.columns]
-        df = df[existing_columns]
+        def write() -> None:
+            # Salvar como Excel
+            if has_xlsxwriter:
+                # O pandas escreve as células coluna a coluna, por isso o modo
+                # constant_memory do xlsxwriter não pode ser usado aqui
+                with pd.ExcelWriter(
+                    output_path,
+                    engine="xlsxwriter",
+                    engine_kwargs={"options": {"strings_to_urls": False}}
+                ) as writer:
+                    df.to_excel(writer, index=False)
+            else:
+                df.to_excel(output_path, index=False)
         
-        # Salvar como Excel
-        df.to_excel(output_path, index=False)
+        self._write_output(output_path, write)
         
         logger.info(f"Exportado para Excel: {output_path}")
         return output_path
@@ -168,14 +248,20 @@ class ReferenceService:
             str: Caminho do arquivo JSON gerado
         """
         # Gerar referências
-        processed_items = self.generate_references(extraction_result)
+        df = self._build_dataframe(extraction_result)
         
-        # Criar diretório de saída se não existir
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        def write() -> None:
+            # Salvar como JSON (orjson escreve UTF-8 diretamente)
+            if has_orjson:
+                with open(output_path, "wb") as f:
+                    f.write(orjson.dumps(
+                        df.to_dict(orient="records"),
+                        option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+                    ))
+            else:
+                df.to_json(output_path, orient="records", force_ascii=False, indent=2)
         
-        # Salvar como JSON
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(processed_items, f, ensure_ascii=False, indent=2)
+        self._write_output(output_path, write)
         
         logger.info(f"Exportado para JSON: {output_path}")
         return output_path
@@ -1,6 +1,7 @@
 # app/utils/barcode_generator.py
 import logging
-from typing import Dict, Any, List, Optional
+import pandas as pd
+from typing import Dict, Any, List, Optional, Tuple, Callable
 from app.data.reference_data import (
     COLOR_CODE_MAP, SIZE_MAP, SUPPLIER_CODE_MAP,
     get_color_code, get_size_code, get_supplier_code
@@ -9,6 +10,31 @@ from app.utils.supplier_utils import match_supplier_name, get_normalized_supplie
 
 logger = logging.getLogger(__name__)
 
+# Tabelas de números já formatados com zeros à esquerda
+_ZFILL2 = [f"{i:02d}" for i in range(100)]
+_ZFILL3 = [f"{i:03d}" for i in range(1000)]
+
+def _supplier_barcode_code(supplier: str, _get_normalized_supplier: Callable = get_normalized_supplier) -> str:
+    """Código de fornecedor com 2 dígitos ("00" quando não há código)"""
+    supplier_code = _get_normalized_supplier(supplier)[1]
+    return _ZFILL2[int(supplier_code)] if supplier_code else "00"
+
+def _counter_barcode_code(product_counter: int) -> str:
+    """Contador com 3 dígitos (100 + contador)"""
+    return _ZFILL3[100 + min(product_counter, 899)]
+
+def _color_barcode_code(color_code: str) -> str:
+    """Código de cor com 3 dígitos ("001" quando não há cor)"""
+    return str(color_code).zfill(3) if color_code else "001"
+
+def _size_barcode_code(size: str, _get_size_code: Callable = get_size_code) -> str:
+    """Código de tamanho com 3 dígitos ("001" quando o tamanho é desconhecido)"""
+    return str(_get_size_code(size) or "001").zfill(3)
+
+def _fallback_barcode(product_counter: int) -> str:
+    """Código de barras de recurso quando algum dos códigos não pode ser obtido"""
+    return f"0001100{str(product_counter).zfill(3)}001001"
+
 def generate_barcode(
     supplier: str,
     product_counter: int,
@@ -18,39 +44,17 @@ def generate_barcode(
 ) -> str:
     """
     Gerador de código de barras com tratamentos para casos especiais
-    """
-    try:
-        from app.utils.supplier_utils import get_normalized_supplier
-        from app.data.reference_data import get_size_code
-        
-        # Normalizar fornecedor
-        normalized_supplier, supplier_code = get_normalized_supplier(supplier)
-        
-        # Fallback para casos sem código de fornecedor
-        if not supplier_code:
-            supplier_code = "00"
-        
-        # Garantir 2 dígitos para código de fornecedor
-        supplier_code = str(supplier_code).zfill(2)
-        
-        # Calcular contador (3 dígitos: 100 + contador)
-        counter_code = str(100 + min(product_counter, 899)).zfill(3)
-        
-        # Normalizar código de cor
-        color_code = str(color_code).zfill(3) if color_code else "001"
-        
-        # Obter código de tamanho
-        size_code = get_size_code(size) or "001"
-        size_code = str(size_code).zfill(3)
-        
-        # Compor código de barras
-        barcode = f"{season_code}{supplier_code}{counter_code}{color_code}{size_code}"
-        
-        return barcode
     
-    except Exception as e:
-        logging.error(f"Erro ao gerar código de barras: {str(e)}")
-        return f"0001100{str(product_counter).zfill(3)}001001"
+    Os erros de normalização propagam-se para o chamador.
+    """
+    # Compor código de barras
+    return "".join((
+        season_code,
+        _supplier_barcode_code(supplier),
+        _counter_barcode_code(product_counter),
+        _color_barcode_code(color_code),
+        _size_barcode_code(size)
+    ))
 
 def normalize_size_value(size: str) -> str:
     if not size:
@@ -63,57 +67,125 @@ def normalize_size_value(size: str) -> str:
     # Caso contrário, retornar o tamanho original
     return size
 
+def _codes_for_distinct(values: List[Any], to_code: Callable[[Any], str]) -> pd.Series:
+    """
+    Converte valores em códigos chamando to_code uma única vez por valor distinto
+    
+    Args:
+        values: Valores por SKU
+        to_code: Função que devolve o código de um valor
+        
+    Returns:
+        pd.Series: Código de cada SKU (None quando to_code falhou para o valor)
+    """
+    codes = {}
+    for value in dict.fromkeys(values):
+        try:
+            codes[value] = to_code(value)
+        except Exception as e:
+            logger.error(f"Erro ao gerar código para '{value}': {str(e)}")
+            codes[value] = None
+    return pd.Series([codes[value] for value in values], dtype=object)
+
+def _build_barcodes(
+    owners: List[int],
+    suppliers: List[str],
+    color_codes: List[str],
+    sizes: List[str],
+    season_code: str = "00"
+) -> Tuple[List[int], List[str]]:
+    """
+    Calcula contadores e códigos de barras para todos os SKUs de uma vez.
+    
+    Os códigos de fornecedor, cor e tamanho são resolvidos uma vez por valor
+    distinto e as colunas são concatenadas de forma vetorizada. Os SKUs cujo
+    código não pôde ser resolvido recebem o código de barras de recurso.
+    
+    Args:
+        owners: Índice do produto de cada SKU (por ordem)
+        suppliers: Fornecedor de cada SKU
+        color_codes: Código de cor de cada SKU
+        sizes: Tamanho de cada SKU
+        season_code: Código da temporada
+        
+    Returns:
+        Tuple: (contadores por produto, códigos de barras)
+    """
+    owner_series = pd.Series(owners)
+    
+    # Contador sequencial por produto (1, 2, 3, ...)
+    counters = owner_series.groupby(owner_series).cumcount() + 1
+    counter_codes = counters.map(_counter_barcode_code)
+    
+    supplier_col = _codes_for_distinct(suppliers, _supplier_barcode_code)
+    color_col = _codes_for_distinct(color_codes, _color_barcode_code)
+    size_col = _codes_for_distinct(sizes, _size_barcode_code)
+    
+    failed = supplier_col.isna() | color_col.isna() | size_col.isna()
+    barcodes = (season_code + supplier_col.fillna("") + counter_codes
+                + color_col.fillna("") + size_col.fillna(""))
+    
+    # Código de barras de recurso apenas para os SKUs com erro
+    if failed.any():
+        fallback = counters.map(_fallback_barcode)
+        barcodes = barcodes.where(~failed, fallback)
+    
+    return counters.tolist(), barcodes.tolist()
+
 def add_barcodes_to_products(products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     try:
-        product_counters = {}
+        # Recolher todos os SKUs (tamanhos com quantidade) numa única passagem
+        owners, suppliers, color_codes, color_names, sizes, quantities = [], [], [], [], [], []
         
-        for product in products:
-            material_code = product.get("material_code", "")
+        for product_idx, product in enumerate(products):
             brand = product.get("brand", "")
             
-            # Reiniciar contador por produto para garantir numeração única
-            product_counters[material_code] = 0
-            
-            references_with_barcodes = []
-            
-            # Iterar por todas as cores do produto
             for color in product.get("colors", []):
                 color_code = color.get("color_code", "")
                 color_name = color.get("color_name", "")
                 supplier = color.get("supplier", brand)
                 
-                # Iterar por todos os tamanhos da cor
                 for size_info in color.get("sizes", []):
-                    size = size_info.get("size", "")
-                    quantity = size_info.get("quantity", 0)
-                    
-                    if quantity <= 0:
+                    try:
+                        quantity = size_info.get("quantity", 0)
+                        
+                        if quantity <= 0:
+                            continue
+                        
+                        size = size_info.get("size", "")
+                    except Exception as e:
+                        # Ignorar apenas o SKU inválido; os restantes mantêm as referências
+                        logger.error(f"Erro ao ler tamanho do produto {product.get('material_code', 'N/A')}: {str(e)}")
                         continue
                     
-                    # Incrementar contador global para o produto
-                    product_counters[material_code] += 1
-                    counter = product_counters[material_code]
-                    
-                    # Criar referência com código de barras
-                    reference = {
-                        "reference": f"{material_code}.{counter}",
-                        "counter": counter,
-                        "color_code": color_code,
-                        "color_name": color_name,
-                        "size": size,
-                        "quantity": quantity,
-                        "barcode": generate_barcode(
-                            supplier=supplier,
-                            product_counter=counter,
-                            color_code=color_code,
-                            size=size
-                        )
-                    }
-                    
-                    references_with_barcodes.append(reference)
+                    owners.append(product_idx)
+                    suppliers.append(supplier)
+                    color_codes.append(color_code)
+                    color_names.append(color_name)
+                    sizes.append(size)
+                    quantities.append(quantity)
+        
+        references_by_product = [[] for _ in products]
+        
+        if owners:
+            counters, barcodes = _build_barcodes(owners, suppliers, color_codes, sizes)
+            material_codes = [product.get("material_code", "") for product in products]
             
-            # Substituir referencias do produto
-            product["references"] = references_with_barcodes
+            for i, product_idx in enumerate(owners):
+                counter = counters[i]
+                references_by_product[product_idx].append({
+                    "reference": f"{material_codes[product_idx]}.{counter}",
+                    "counter": counter,
+                    "color_code": color_codes[i],
+                    "color_name": color_names[i],
+                    "size": sizes[i],
+                    "quantity": quantities[i],
+                    "barcode": barcodes[i]
+                })
+        
+        # Substituir referencias dos produtos
+        for product, references in zip(products, references_by_product):
+            product["references"] = references
         
         return products
     
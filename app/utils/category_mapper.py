@@ -1,6 +1,9 @@
 # app/utils/category_mapper.py
 import re
 import logging
+from functools import lru_cache
+from bisect import bisect_right
+from itertools import accumulate
 from difflib import get_close_matches
 from typing import Dict, List, Optional
 
@@ -8,6 +11,12 @@ from app.data.reference_data import CATEGORIES, get_category
 
 logger = logging.getLogger(__name__)
 
+try:
+    from rapidfuzz import fuzz, process
+    has_rapidfuzz = True
+except ImportError:
+    has_rapidfuzz = False
+
 # Mapeamento de categorias em inglês para português
 ENGLISH_TO_PORTUGUESE = {
     # Camisas e similares
@@ -120,6 +129,88 @@ BOSS_POLO_PATTERNS = [
     r"PLISY", r"PRIDE", r"PENROSE", r"PALLAS"
 ]
 
+# Palavras-chave procuradas no texto da categoria (a ordem define a prioridade)
+CATEGORY_KEYWORDS = {
+    "SHIRT": "CAMISAS",
+    "COAT": "CASACOS",
+    "JACKET": "CASACOS",
+    "DRESS": "VESTIDOS",
+    "BLOUSE": "BLUSAS",
+    "TOP": "BLUSAS",
+    "PANT": "CALÇAS",
+    "TROUSER": "CALÇAS",
+    "KNIT": "MALHAS",
+    "SWEATER": "MALHAS",
+    "SKIRT": "SAIAS",
+    "TEE": "T-SHIRTS",
+    "POLO": "POLOS",
+    "JEAN": "JEANS",
+    "DENIM": "JEANS",
+    "SWEAT": "SWEATSHIRTS",
+    "HOODIE": "SWEATSHIRTS",
+    "BLAZER": "BLAZERS E FATOS",
+    "SUIT": "BLAZERS E FATOS",
+    "SHOE": "CALÇADO",
+    "BOOT": "CALÇADO",
+    "SNEAKER": "CALÇADO"
+}
+
+# Padrões pré-compilados numa única alternância (uma só passagem pela string)
+_BOSS_POLO_RE = re.compile("|".join(BOSS_POLO_PATTERNS))
+
+# Lookahead para encontrar todas as palavras-chave, incluindo sobrepostas
+_KEYWORD_RE = re.compile("(?=(" + "|".join(re.escape(k) for k in CATEGORY_KEYWORDS) + "))")
+_KEYWORD_RANK = {keyword: rank for rank, keyword in enumerate(CATEGORY_KEYWORDS)}
+
+# Índices para a correspondência parcial com ENGLISH_TO_PORTUGUESE (etapa 6)
+_ENG_KEYS = list(ENGLISH_TO_PORTUGUESE)
+_ENG_RANK = {key: rank for rank, key in enumerate(_ENG_KEYS)}
+_ENG_RE = re.compile("(?=(" + "|".join(re.escape(k) for k in _ENG_KEYS) + "))")
+# Todas as chaves numa só string, para procurar a categoria dentro delas
+_ENG_BLOB = "\n".join(_ENG_KEYS)
+_ENG_STARTS = [0, *accumulate(len(k) + 1 for k in _ENG_KEYS[:-1])]
+
+def _find_partial_english(category_upper: str) -> Optional[str]:
+    """
+    Encontra a primeira chave (pela ordem de ENGLISH_TO_PORTUGUESE) contida
+    na categoria ou que contém a categoria
+    
+    Args:
+        category_upper: Categoria em maiúsculas
+        
+    Returns:
+        str: Chave encontrada ou None
+    """
+    best_rank = len(_ENG_KEYS)
+    
+    # Chaves contidas na categoria
+    for m in _ENG_RE.finditer(category_upper):
+        best_rank = min(best_rank, _ENG_RANK[m.group(1)])
+    
+    # Categoria contida numa chave: a primeira ocorrência é a de menor ordem
+    if "\n" not in category_upper:
+        pos = _ENG_BLOB.find(category_upper)
+        if pos >= 0:
+            best_rank = min(best_rank, bisect_right(_ENG_STARTS, pos) - 1)
+    
+    return _ENG_KEYS[best_rank] if best_rank < len(_ENG_KEYS) else None
+
+def _find_category_keyword(category_upper: str) -> Optional[str]:
+    """
+    Encontra a palavra-chave de maior prioridade presente na categoria
+    
+    Args:
+        category_upper: Categoria em maiúsculas
+        
+    Returns:
+        str: Palavra-chave encontrada ou None
+    """
+    hits = [m.group(1) for m in _KEYWORD_RE.finditer(category_upper)]
+    if not hits:
+        return None
+    return min(hits, key=_KEYWORD_RANK.__getitem__)
+
+@lru_cache(maxsize=4096)
 def get_best_category_match(category: str) -> str:
     """
     Obtém a correspondência mais próxima na lista de categorias
@@ -134,9 +225,17 @@ def get_best_category_match(category: str) -> str:
         return "ACESSÓRIOS"
     
     # Tentar encontrar correspondências diretas ou próximas
-    matches = get_close_matches(category.upper(), CATEGORIES, n=1, cutoff=0.6)
-    if matches:
-        return matches[0]
+    if has_rapidfuzz:
+        # fuzz.ratio (distância Indel normalizada) é próxima do ratio do difflib, em C++
+        match = process.extractOne(
+            category.upper(), CATEGORIES, scorer=fuzz.ratio, score_cutoff=60
+        )
+        if match:
+            return match[0]
+    else:
+        matches = get_close_matches(category.upper(), CATEGORIES, n=1, cutoff=0.6)
+        if matches:
+            return matches[0]
     
     # Se não encontrar, retornar categoria padrão
     return "ACESSÓRIOS"
@@ -164,6 +263,20 @@ def map_category(
     if not category:
         category = ""
     
+    # O nome do produto e a marca só são usados (em maiúsculas) se ambos existirem
+    if product_name and brand:
+        return _map_category_cached(category, product_name.upper(), brand.upper())
+    return _map_category_cached(category, None, None)
+
+@lru_cache(maxsize=8192)
+def _map_category_cached(
+    category: str,
+    product_upper: Optional[str],
+    brand_upper: Optional[str]
+) -> str:
+    """
+    Implementação de map_category, em cache por (categoria, produto, marca)
+    """
     # 1. Conversão para maiúsculas para facilitar a comparação
     category_upper = category.upper().strip()
     
@@ -177,17 +290,13 @@ def map_category(
         return normalized
     
     # 4. Verificar casos especiais baseados no nome do produto e marca
-    if product_name and brand:
-        product_upper = product_name.upper()
-        brand_upper = brand.upper()
-        
+    if product_upper and brand_upper:
         # Caso especial: Polos/Jerseys da Hugo Boss
         if "HUGO BOSS" in brand_upper or "BOSS" in brand_upper:
             # Verificar se o nome do produto contém padrões de polos
-            for pattern in BOSS_POLO_PATTERNS:
-                if re.search(pattern, product_upper):
-                    logger.info(f"Produto HUGO BOSS mapeado como POLO: {product_name}")
-                    return "POLOS"
+            if _BOSS_POLO_RE.search(product_upper):
+                logger.info(f"Produto HUGO BOSS mapeado como POLO: {product_upper}")
+                return "POLOS"
             
             # Verificar palavras específicas no nome do produto
             if any(word in product_upper for word in ["POLO", "JERSEY", "KNIT SHIRT"]):
@@ -200,41 +309,18 @@ def map_category(
         return translated
     
     # 6. Tentar encontrar correspondência parcial no dicionário
-    for eng, pt in ENGLISH_TO_PORTUGUESE.items():
-        if eng in category_upper or category_upper in eng:
-            logger.info(f"Correspondência parcial para '{category}': '{pt}'")
-            return pt
+    eng = _find_partial_english(category_upper)
+    if eng:
+        pt = ENGLISH_TO_PORTUGUESE[eng]
+        logger.info(f"Correspondência parcial para '{category}': '{pt}'")
+        return pt
     
     # 7. Procurar por palavras-chave no texto da categoria
-    keywords = {
-        "SHIRT": "CAMISAS",
-        "COAT": "CASACOS",
-        "JACKET": "CASACOS",
-        "DRESS": "VESTIDOS",
-        "BLOUSE": "BLUSAS",
-        "TOP": "BLUSAS",
-        "PANT": "CALÇAS",
-        "TROUSER": "CALÇAS",
-        "KNIT": "MALHAS",
-        "SWEATER": "MALHAS",
-        "SKIRT": "SAIAS",
-        "TEE": "T-SHIRTS",
-        "POLO": "POLOS",
-        "JEAN": "JEANS",
-        "DENIM": "JEANS",
-        "SWEAT": "SWEATSHIRTS",
-        "HOODIE": "SWEATSHIRTS",
-        "BLAZER": "BLAZERS E FATOS",
-        "SUIT": "BLAZERS E FATOS",
-        "SHOE": "CALÇADO",
-        "BOOT": "CALÇADO",
-        "SNEAKER": "CALÇADO"
-    }
-    
-    for keyword, cat in keywords.items():
-        if keyword in category_upper:
-            logger.info(f"Palavra-chave '{keyword}' encontrada em '{category}': mapeado para '{cat}'")
-            return cat
+    keyword = _find_category_keyword(category_upper)
+    if keyword:
+        cat = CATEGORY_KEYWORDS[keyword]
+        logger.info(f"Palavra-chave '{keyword}' encontrada em '{category}': mapeado para '{cat}'")
+        return cat
     
     best_match = get_best_category_match(category)
     logger.info(f"Nenhuma correspondência encontrada para '{category}', usando melhor aproximação: '{best_match}'")
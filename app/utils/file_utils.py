@@ -2,52 +2,157 @@
 import os
 import fitz  # PyMuPDF
 import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
 from PIL import Image
 from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
-def convert_pdf_to_images(pdf_path: str, output_dir: str, dpi: int = 150, pages: Optional[List[int]] = None) -> List[str]:
+# Pool de processos partilhado para renderizar páginas de PDF, criado no
+# primeiro uso e reutilizado entre chamadas
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_lock = threading.Lock()
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    """
+    Devolve o pool de processos de renderização, criando-o se necessário.
+    
+    Usa "forkserver" (ou "spawn" onde não existe): o processo da API já tem
+    threads (gRPC do Gemini, servidor), e fazer fork de um processo com
+    threads pode deixar os filhos bloqueados.
+    
+    Returns:
+        ProcessPoolExecutor: Pool partilhado
     """
-    Converte um PDF em imagens, uma por página.
+    global _render_pool
+    
+    with _render_pool_lock:
+        if _render_pool is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _render_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context(start_method)
+            )
+        return _render_pool
+
+def _discard_render_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Descarta o pool de renderização (ex: após um worker terminar de forma
+    abrupta), para que a próxima chamada crie um novo.
+    
+    Args:
+        pool: Pool que falhou
+    """
+    global _render_pool
+    
+    with _render_pool_lock:
+        if _render_pool is pool:
+            _render_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _render_page(
+    pdf_path: str,
+    page_idx: int,
+    output_dir: str,
+    zoom: float,
+    max_dimension: Optional[int] = None,
+    quality: int = 85
+) -> str:
+    """
+    Renderiza uma página do PDF diretamente como imagem JPEG.
+    
+    Função de topo (e não aninhada) para poder ser executada num processo separado.
+    
+    Args:
+        pdf_path: Caminho para o arquivo PDF
+        page_idx: Índice da página (0-indexed)
+        output_dir: Diretório onde a imagem será salva
+        zoom: Fator de zoom máximo a aplicar na renderização
+        max_dimension: Dimensão máxima (largura ou altura) da imagem em pixels
+        quality: Qualidade JPEG
+    
+    Returns:
+        str: Caminho para a imagem gerada
+    """
+    with fitz.open(pdf_path) as pdf_document:
+        page = pdf_document.load_page(page_idx)
+        
+        # Renderizar já na dimensão final, evitando redimensionar depois
+        if max_dimension:
+            zoom = min(zoom, max_dimension / page.rect.width, max_dimension / page.rect.height)
+        
+        # Renderizar página como imagem com zoom
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        
+        # Salvar imagem
+        output_path = os.path.join(output_dir, f"{os.path.basename(pdf_path)}_page_{page_idx+1}.jpg")
+        with open(output_path, "wb") as f:
+            f.write(pix.tobytes("jpeg", jpg_quality=quality))
+    
+    return output_path
+
+def convert_pdf_to_images(
+    pdf_path: str,
+    output_dir: str,
+    dpi: int = 150,
+    pages: Optional[List[int]] = None,
+    max_dimension: Optional[int] = 1200
+) -> List[str]:
+    """
+    Converte um PDF em imagens JPEG, uma por página.
+    
+    As páginas são renderizadas em paralelo num pool de processos partilhado
+    (até ao número de CPUs disponíveis). A chamada é bloqueante: em código
+    assíncrono deve ser executada fora do event loop (ex: asyncio.to_thread).
     
     Args:
         pdf_path: Caminho para o arquivo PDF
         output_dir: Diretório onde as imagens serão salvas
         dpi: Resolução das imagens em DPI
         pages: Lista opcional de índices de páginas a converter (0-indexed). Se None, converte todas.
+        max_dimension: Dimensão máxima das imagens em pixels (None para não limitar)
     
     Returns:
         List[str]: Lista de caminhos para as imagens geradas
     """
     try:
-        # Abrir o documento PDF
-        pdf_document = fitz.open(pdf_path)
-        
-        image_paths = []
-        
         # Determinar quais páginas converter
+        with fitz.open(pdf_path) as pdf_document:
+            page_count = len(pdf_document)
+        
         if pages is None:
-            page_indices = range(len(pdf_document))
+            page_indices = list(range(page_count))
         else:
-            page_indices = [p for p in pages if 0 <= p < len(pdf_document)]
+            page_indices = [p for p in pages if 0 <= p < page_count]
         
-        # Iterar por cada página
-        for page_idx in page_indices:
-            page = pdf_document.load_page(page_idx)
-            
-            # Ajustar zoom com base no DPI (2.0 = 192 DPI, 1.5 = 144 DPI)
-            zoom_factor = dpi / 96  # 96 DPI é o padrão
-            
-            # Renderizar página como imagem com zoom
-            pix = page.get_pixmap(matrix=fitz.Matrix(zoom_factor, zoom_factor))
-            
-            # Salvar imagem
-            output_path = os.path.join(output_dir, f"{os.path.basename(pdf_path)}_page_{page_idx+1}.png")
-            pix.save(output_path)
-            image_paths.append(output_path)
-            
-        return image_paths
+        # Ajustar zoom com base no DPI (2.0 = 192 DPI, 1.5 = 144 DPI)
+        zoom_factor = dpi / 96  # 96 DPI é o padrão
+        
+        render = partial(
+            _render_page, pdf_path,
+            output_dir=output_dir, zoom=zoom_factor, max_dimension=max_dimension
+        )
+        
+        # Não compensa criar processos para uma única página
+        if len(page_indices) <= 1:
+            return [render(page_idx) for page_idx in page_indices]
+        
+        # Um worker que termina de forma abrupta (ex: falha do MuPDF) inutiliza o
+        # pool: descartá-lo e tentar uma vez num pool novo. Não se renderiza no
+        # próprio processo, porque a mesma falha derrubaria o servidor.
+        for attempt in range(2):
+            pool = _get_render_pool()
+            try:
+                return list(pool.map(render, page_indices))
+            except BrokenProcessPool:
+                _discard_render_pool(pool)
+                if attempt:
+                    raise
+                logger.warning("Pool de renderização interrompido, a tentar novamente com um novo pool")
     
     except Exception as e:
         logger.error(f"Erro ao converter PDF para imagens: {str(e)}")
@@ -56,14 +161,17 @@ def convert_pdf_to_images(pdf_path: str, output_dir: str, dpi: int = 150, pages:
 def extract_text_from_pdf(pdf_path: str) -> str:
     """Extrai texto de um arquivo PDF."""
     try:
-        pdf_document = fitz.open(pdf_path)
-        text = ""
+        # Flags por omissão do get_text("text"), para manter o texto extraído,
+        # com espaços preservados e recorte à área da página
+        flags = fitz.TEXTFLAGS_TEXT | fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_MEDIABOX_CLIP
         
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            text += page.get_text()
+        with fitz.open(pdf_path) as pdf_document:
+            parts = [
+                pdf_document.load_page(page_num).get_text("text", flags=flags)
+                for page_num in range(len(pdf_document))
+            ]
             
-        return text
+        return "".join(parts)
     except Exception as e:
         logger.error(f"Erro ao extrair texto do PDF {pdf_path}: {str(e)}")
         return ""
@@ -72,6 +180,18 @@ def optimize_image(image_path: str, output_dir: str, max_dimension: int = 1200,
     """Otimiza uma imagem para processamento de visão computacional."""
     try:
         with Image.open(image_path) as img:
+            # Imagens já em JPEG RGB dentro do limite (ex: páginas de PDF
+            # renderizadas por convert_pdf_to_images) não precisam de nova codificação
+            if (img.format == "JPEG" and img.mode == "RGB" and
+                    img.width <= max_dimension and img.height <= max_dimension):
+                return image_path
+            
+            original_size = img.size
+            
+            # JPEG grande: pedir ao libjpeg que descodifique já a uma escala reduzida
+            if img.format == "JPEG" and (img.width > max_dimension or img.height > max_dimension):
+                img.draft("RGB", (max_dimension, max_dimension))
+            
             # Converter para RGB se for RGBA
             if img.mode == 'RGBA':
                 img = img.convert('RGB')
@@ -80,8 +200,9 @@ def optimize_image(image_path: str, output_dir: str, max_dimension: int = 1200,
             if img.width > max_dimension or img.height > max_dimension:
                 ratio = min(max_dimension / img.width, max_dimension / img.height)
                 new_size = (int(img.width * ratio), int(img.height * ratio))
-                logger.info(f"Redimensionando imagem de {img.width}x{img.height} para {new_size[0]}x{new_size[1]}")
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
+                logger.info(f"Redimensionando imagem de {original_size[0]}x{original_size[1]} para {new_size[0]}x{new_size[1]}")
+                # reducing_gap faz primeiro um reduce() inteiro e só depois o LANCZOS
+                img = img.resize(new_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
             
             # Salvar com compressão otimizada
             output_path = os.path.join(output_dir, f"opt_{os.path.basename(image_path)}")
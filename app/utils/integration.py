@@ -3,14 +3,9 @@
 Utilitário para integrar o sistema de recuperação na aplicação existente.
 """
 import logging
-import json
 import math
 from typing import Dict, Any, List, Optional
 from app.utils.recovery_system import integrate_recovery_system
-from app.extractors.gemini_extractor import GeminiExtractor
-import pandas as pd
-import re
-import app.main
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +15,8 @@ def setup_recovery_system():
     Deve ser chamado durante a inicialização.
     """
     try:
+        from app.extractors.gemini_extractor import GeminiExtractor
+        
         integrate_recovery_system(GeminiExtractor)
         
         logger.info("Sistema de recuperação configurado com sucesso")
@@ -28,28 +25,14 @@ def setup_recovery_system():
         logger.error(f"Erro ao configurar sistema de recuperação: {str(e)}")
         return False
 
-def patch_json_encoder():
-    """
-    Substitui o encoder JSON padrão para lidar com valores NaN e Infinity.
-    """
-    original_default = json.JSONEncoder.default
-    
-    def patched_default(self, obj):
-        """Encoder personalizado que trata valores NaN e Infinity"""
-        if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
-            return None
-        return original_default(self, obj)
-    
-    # Aplicar o patch
-    json.JSONEncoder.default = patched_default
-    logger.info("Encoder JSON modificado para tratar valores NaN e Infinity")
-
 def monkey_patch_dataframe_conversion():
     """
     Aplica monkey patch à função de conversão para DataFrame
     para garantir sanitização de valores.
     """
     try:
+        import app.main
+        
         # Definir função de sanitização básica
         def sanitize_value(value):
             """Sanitiza um valor para evitar problemas com NaN"""
@@ -63,10 +46,10 @@ def monkey_patch_dataframe_conversion():
             # Chamar função original
             df = create_dataframe_from_extraction(*args, **kwargs)
             
-            # Sanitizar valores NaN
-            for col in df.columns:
-                if df[col].dtype == 'float64' or df[col].dtype == 'float32':
-                    df[col] = df[col].fillna(0.0)
+            # Sanitizar valores NaN de todas as colunas float numa única operação
+            float_cols = df.select_dtypes(include=['float64', 'float32']).columns
+            if len(float_cols):
+                df[float_cols] = df[float_cols].fillna(0.0)
             
             return df
         
@@ -84,7 +67,6 @@ def initialize_recovery_features():
     Inicializa todas as funcionalidades de recuperação.
     Deve ser chamado na inicialização da aplicação.
     """
-    patch_json_encoder()
     monkey_patch_dataframe_conversion()
     
     recovery_configured = setup_recovery_system()
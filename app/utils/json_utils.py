@@ -2,81 +2,237 @@
 import json
 import math
 import logging
+import numpy as np
 from typing import Any, Dict, List, Optional, Union, Tuple
 
+try:
+    import orjson
+    has_orjson = True
+except ImportError:
+    has_orjson = False
+
 logger = logging.getLogger(__name__)
 
+_isfinite = math.isfinite
+
+def _is_bad_number(value: Any) -> bool:
+    """
+    Verifica se um valor numérico está ausente ou é inválido (None, NaN ou Infinity)
+    """
+    return value is None or (isinstance(value, float) and not _isfinite(value))
+
+# Tipos escalares que o encoder JSON aceita sempre, sem necessidade de testar
+_JSON_SCALAR_TYPES = (str, int, float, bool)
+
 def is_json_serializable(obj: Any) -> bool:
     """
     Verifica se um objeto é serializável para JSON
     """
+    # Caminho rápido: escalares nativos não precisam de passar pelo encoder
+    if obj is None or isinstance(obj, _JSON_SCALAR_TYPES):
+        return True
+    
     try:
         json.dumps(obj)
         return True
     except (TypeError, OverflowError):
         return False
 
+def _contains_bad(
+    obj: Any,
+    default_str: str = "",
+    max_depth: int = 100,
+    current_depth: int = 0
+) -> bool:
+    """
+    Verifica (sem alocar cópias) se a sanitização alteraria o objeto.
+    Para no primeiro valor problemático encontrado.
+    """
+    stack = [(obj, current_depth)]
+    pop = stack.pop
+    push = stack.append
+    
+    while stack:
+        value, depth = pop()
+        
+        if depth > max_depth:
+            return True
+        
+        if value is None:
+            continue
+        
+        value_type = type(value)
+        
+        if value_type is float:
+            if not _isfinite(value):
+                return True
+        elif value_type is str:
+            if not value and value != default_str:
+                return True
+        elif value_type is int or value_type is bool:
+            continue
+        elif value_type is dict or value_type is list:
+            # Contentores não vazios no limite de profundidade são descartados
+            if value and depth >= max_depth:
+                return True
+            child_depth = depth + 1
+            for item in (value.values() if value_type is dict else value):
+                push((item, child_depth))
+        else:
+            # Tuplos, subclasses e tipos desconhecidos seguem o caminho completo
+            return True
+    
+    return False
+
 def sanitize_for_json(
     obj: Any, 
     default_number: float = 0.0,
     default_str: str = "",
     max_depth: int = 100,
-    current_depth: int = 0
+    current_depth: int = 0,
+    inplace: bool = False
 ) -> Any:
     """
-    Sanitiza recursivamente um objeto para garantir que seja serializável para JSON.
+    Sanitiza um objeto para garantir que seja serializável para JSON.
     Substitui valores problemáticos como NaN e Infinity por defaults seguros.
-    """
-    if current_depth > max_depth:
-        logger.warning(f"Profundidade máxima de recursão atingida ({max_depth})")
-        return None
     
-    if obj is None:
-        return None
+    A travessia é iterativa, com uma pilha explícita de frames
+    (contentor, chave, valor, profundidade), evitando o custo de uma chamada
+    Python por nó e o risco de RecursionError em estruturas profundas.
+    Se o objeto já estiver limpo, é devolvido sem ser reconstruído.
     
-    if isinstance(obj, (int, float)):
-        if isinstance(obj, float) and (math.isnan(obj) or math.isinf(obj)):
-            logger.debug(f"Valor numérico inválido (NaN/Infinity) substituído por {default_number}")
-            return default_number
+    Com inplace=True, dicionários e listas do próprio objeto são alterados
+    diretamente (só os valores substituídos são escritos); deve ser usado
+    apenas por quem é dono do objeto.
+    """
+    if not _contains_bad(obj, default_str, max_depth, current_depth):
         return obj
     
-    if isinstance(obj, str):
-        if not obj or not is_json_serializable(obj):
-            return default_str
-        return obj
+    # O resultado final é escrito na posição 0 deste contentor auxiliar
+    root = [obj]
+    stack = [(root, 0, obj, current_depth)]
+    pop = stack.pop
+    push = stack.append
     
-    if isinstance(obj, dict):
-        return {
-            k: sanitize_for_json(
-                v, 
-                default_number=default_number,
-                default_str=default_str,
-                max_depth=max_depth,
-                current_depth=current_depth + 1
-            ) 
-            for k, v in obj.items()
-        }
-    
-    if isinstance(obj, (list, tuple)):
-        return [
-            sanitize_for_json(
-                item, 
-                default_number=default_number,
-                default_str=default_str,
-                max_depth=max_depth,
-                current_depth=current_depth + 1
-            ) 
-            for item in obj
-        ]
-    
-    if is_json_serializable(obj):
-        return obj
+    while stack:
+        parent, key, value, depth = pop()
+        
+        if depth > max_depth:
+            logger.warning(f"Profundidade máxima de recursão atingida ({max_depth})")
+            new = None
+        
+        elif value is None:
+            # Os contentores novos já são pré-preenchidos com None
+            continue
+        
+        elif isinstance(value, (int, float)):
+            new = value
+            if isinstance(value, float) and not _isfinite(value):
+                logger.debug(f"Valor numérico inválido (NaN/Infinity) substituído por {default_number}")
+                new = default_number
+        
+        elif isinstance(value, str):
+            new = value if value else default_str
+        
+        elif value and depth >= max_depth and isinstance(value, (dict, list, tuple)):
+            # No limite de profundidade, não construir um contentor cujos
+            # filhos seriam todos descartados
+            logger.warning(f"Profundidade máxima de recursão atingida ({max_depth})")
+            new = None
+        
+        elif isinstance(value, dict):
+            child_depth = depth + 1
+            if inplace:
+                new = value
+                for k, v in value.items():
+                    push((new, k, v, child_depth))
+            else:
+                # Pré-criar as chaves para preservar a ordem original
+                new = dict.fromkeys(value)
+                for k, v in value.items():
+                    push((new, k, v, child_depth))
+        
+        elif isinstance(value, (list, tuple)):
+            child_depth = depth + 1
+            if inplace:
+                # Tuplos são convertidos numa lista com os mesmos itens
+                new = value if isinstance(value, list) else list(value)
+            else:
+                new = [None] * len(value)
+            for i, item in enumerate(value):
+                push((new, i, item, child_depth))
+        
+        elif is_json_serializable(value):
+            new = value
+        
+        else:
+            try:
+                new = str(value)
+            except:
+                logger.warning(f"Objeto não serializável do tipo {type(value)} substituído por None")
+                new = None
+        
+        # Em modo inplace só se escrevem os valores que mudaram
+        if not inplace or new is not value:
+            parent[key] = new
     
-    try:
-        return str(obj)
-    except:
-        logger.warning(f"Objeto não serializável do tipo {type(obj)} substituído por None")
-        return None
+    return root[0]
+
+class SafeJSONEncoder(json.JSONEncoder):
+    """
+    Encoder JSON que converte escalares NumPy e substitui NaN/Infinity
+    nesses escalares por None.
+    
+    Deve ser passado explicitamente (cls=SafeJSONEncoder) em vez de
+    modificar json.JSONEncoder globalmente; os floats nativos continuam a
+    usar o caminho rápido do encoder (os dados são sanitizados antes).
+    """
+    
+    def default(self, obj: Any) -> Any:
+        # Escalares NumPy (ex.: valores vindos de DataFrames)
+        if isinstance(obj, np.generic):
+            value = obj.item()
+            if isinstance(value, float) and not _isfinite(value):
+                return None
+            return value
+        
+        return super().default(obj)
+
+def write_json_file(obj: Any, file_path: str, **kwargs) -> None:
+    """
+    Escreve um objeto (já sanitizado) num ficheiro JSON.
+    
+    Usa orjson quando disponível e as opções pedidas são as de omissão
+    (indentação de 2 e UTF-8 sem escapes); caso contrário, ou se o orjson
+    recusar o objeto, usa o módulo json da biblioteca padrão com o
+    SafeJSONEncoder.
+    
+    Args:
+        obj: Objeto a ser salvo
+        file_path: Caminho do arquivo para salvar
+        **kwargs: Opções para json.dump
+    """
+    if (
+        has_orjson
+        and kwargs.get('indent', 2) == 2
+        and not kwargs.get('ensure_ascii', False)
+        and not kwargs.keys() - {'indent', 'ensure_ascii'}
+    ):
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Tipos não suportados pelo orjson seguem para o encoder padrão
+            data = None
+        
+        if data is not None:
+            with open(file_path, 'wb') as f:
+                f.write(data)
+            return
+    
+    kwargs.setdefault('cls', SafeJSONEncoder)
+    
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, **kwargs)
 
 def safe_json_dump(obj: Any, file_path: str, **kwargs) -> bool:
     """
@@ -90,8 +246,7 @@ def safe_json_dump(obj: Any, file_path: str, **kwargs) -> bool:
         if 'ensure_ascii' not in kwargs:
             kwargs['ensure_ascii'] = False
         
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(sanitized_obj, f, **kwargs)
+        write_json_file(sanitized_obj, file_path, **kwargs)
         
         return True
     except Exception as e:
@@ -101,8 +256,7 @@ def safe_json_dump(obj: Any, file_path: str, **kwargs) -> bool:
             logger.warning("Tentando recuperação com sanitização agressiva")
             sanitized_obj = sanitize_for_json(obj, default_number=0.0, default_str="")
             
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(sanitized_obj, f, **kwargs)
+            write_json_file(sanitized_obj, file_path, **kwargs)
             
             return True
         except Exception as e2:
@@ -119,60 +273,59 @@ def fix_nan_in_products(products: List[Dict[str, Any]], markup: float = 2.73) ->
         if not isinstance(product, dict):
             continue
         
+        # Soma dos subtotais das cores mantidas, acumulada no mesmo ciclo
+        # apenas quando o total_price tiver de ser recalculado
+        needs_total = _is_bad_number(product.get("total_price"))
+        sum_subtotals = 0
+        
         if "colors" in product and isinstance(product["colors"], list):
             fixed_colors = []
             
             for color in product["colors"]:
-                if "unit_price" not in color or color["unit_price"] is None or (
-                    isinstance(color["unit_price"], float) and math.isnan(color["unit_price"])
-                ):
-                    color["unit_price"] = 0.0
+                unit_price = color.get("unit_price")
+                if _is_bad_number(unit_price):
+                    unit_price = color["unit_price"] = 0.0
+                
+                if _is_bad_number(color.get("sales_price")):
+                    color["sales_price"] = round(unit_price * markup, 2)
                 
-                if "sales_price" not in color or color["sales_price"] is None or (
-                    isinstance(color["sales_price"], float) and math.isnan(color["sales_price"])
-                ):
-                    color["sales_price"] = round(color["unit_price"] * markup, 2)
+                if _is_bad_number(color.get("subtotal")):
+                    total_quantity = 0
+                    for size in color.get("sizes", []):
+                        quantity = size.get("quantity")
+                        if quantity is not None:
+                            total_quantity += quantity
+                    color["subtotal"] = round(unit_price * total_quantity, 2)
                 
-                if "subtotal" not in color or color["subtotal"] is None or (
-                    isinstance(color["subtotal"], float) and math.isnan(color["subtotal"])
-                ):
-                    total_quantity = sum(
-                        size.get("quantity", 0) 
-                        for size in color.get("sizes", []) 
-                        if size.get("quantity") is not None
-                    )
-                    color["subtotal"] = round(color["unit_price"] * total_quantity, 2)
+                sizes = color.get("sizes")
                 
-                if "sizes" in color and isinstance(color["sizes"], list):
+                if isinstance(sizes, list):
                     fixed_sizes = []
                     
-                    for size in color["sizes"]:
-                        if "quantity" not in size or size["quantity"] is None or (
-                            isinstance(size["quantity"], float) and math.isnan(size["quantity"])
-                        ):
-                            size["quantity"] = 0
+                    for size in sizes:
+                        quantity = size.get("quantity")
+                        if _is_bad_number(quantity):
+                            quantity = size["quantity"] = 0
                         
-                        if size.get("quantity", 0) > 0:
+                        if quantity > 0:
                             fixed_sizes.append(size)
                     
-                    color["sizes"] = fixed_sizes
+                    sizes = color["sizes"] = fixed_sizes
                 
-                if color.get("sizes", []):
+                if sizes:
                     fixed_colors.append(color)
+                    
+                    if needs_total:
+                        subtotal = color.get("subtotal")
+                        if subtotal is not None:
+                            sum_subtotals += subtotal
             
             product["colors"] = fixed_colors
         
-        if "total_price" not in product or product["total_price"] is None or (
-            isinstance(product["total_price"], float) and math.isnan(product["total_price"])
-        ):
-            subtotals = [
-                color.get("subtotal", 0) 
-                for color in product.get("colors", []) 
-                if color.get("subtotal") is not None
-            ]
-            product["total_price"] = sum(subtotals)
+        if needs_total:
+            product["total_price"] = sum_subtotals
         
         if product.get("colors", []):
             fixed_products.append(product)
     
-    return fixed_products
\ No newline at end of file
+    return fixed_products
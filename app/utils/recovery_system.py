@@ -2,12 +2,232 @@
 import os
 import json
 import logging
-import math
 import re
+from functools import lru_cache
 from typing import Dict, Any, List, Optional, Tuple, Callable
 
+from app.utils.json_utils import write_json_file, _isfinite, _is_bad_number
+
+try:
+    from app.data.reference_data import get_supplier_code, get_markup
+    has_reference_data = True
+except ImportError:
+    has_reference_data = False
+
 logger = logging.getLogger(__name__)
 
+def _contains_bad(data: Any) -> bool:
+    """
+    Verifica (sem alocar cópias) se existe algum NaN ou Infinity nos dados.
+    Para no primeiro valor problemático encontrado.
+    """
+    stack = [data]
+    pop = stack.pop
+    extend = stack.extend
+    
+    while stack:
+        value = pop()
+        if isinstance(value, float):
+            if not _isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            extend(value.values())
+        elif isinstance(value, list):
+            extend(value)
+    
+    return False
+
+def _sanitize_with_flag(data: Any, inplace: bool = False) -> Tuple[Any, bool]:
+    """
+    Sanitiza dados e indica se algum valor foi substituído
+    
+    Args:
+        data: Dados a serem sanitizados
+        inplace: Se True, altera dicionários e listas diretamente em vez de os copiar
+        
+    Returns:
+        Tuple[Any, bool]: Dados sanitizados e True se houve substituições
+    """
+    # Dados já limpos são devolvidos sem reconstrução
+    if not _contains_bad(data):
+        return data, False
+    
+    # Travessia iterativa com pilha explícita de (contentor, chave, valor);
+    # o resultado final fica na posição 0 do contentor auxiliar
+    root = [data]
+    stack = [(root, 0, data)]
+    pop = stack.pop
+    push = stack.append
+    
+    while stack:
+        parent, key, value = pop()
+        
+        # Processar dicionários
+        if isinstance(value, dict):
+            if inplace:
+                for k, v in value.items():
+                    push((value, k, v))
+                continue
+            
+            # Chaves pré-criadas, mantendo a ordem
+            out = dict.fromkeys(value)
+            parent[key] = out
+            for k, v in value.items():
+                push((out, k, v))
+            continue
+        
+        # Processar listas
+        if isinstance(value, list):
+            if inplace:
+                for i, item in enumerate(value):
+                    push((value, i, item))
+                continue
+            
+            out = [None] * len(value)
+            parent[key] = out
+            for i, item in enumerate(value):
+                push((out, i, item))
+            continue
+        
+        # Substituir NaN e infinito por None
+        if isinstance(value, float) and not _isfinite(value):
+            parent[key] = None
+            continue
+        
+        # Retornar outros tipos sem modificação
+        if not inplace:
+            parent[key] = value
+    
+    return root[0], True
+
+def _is_result_clean(extraction_result: Dict[str, Any]) -> bool:
+    """
+    Verifica se um resultado de extração já está válido, ou seja, se
+    fix_extraction_result não alteraria nenhum valor
+    
+    Args:
+        extraction_result: Resultado da extração (com products e order_info)
+        
+    Returns:
+        bool: True se o resultado pode ser devolvido sem correções
+    """
+    products = extraction_result.get("products")
+    if not isinstance(products, list):
+        return False
+    
+    for product in products:
+        if not isinstance(product, dict):
+            return False
+        
+        # O nome já tem de estar limpo
+        name = product.get("name")
+        if name and (not isinstance(name, str) or _clean_product_name_cached(name) != name):
+            return False
+        
+        if _is_bad_number(product.get("total_price")):
+            return False
+        
+        colors = product.get("colors")
+        if not isinstance(colors, list):
+            return False
+        
+        has_valid_items = False
+        for color in colors:
+            if not isinstance(color, dict):
+                return False
+            
+            if (
+                _is_bad_number(color.get("unit_price"))
+                or _is_bad_number(color.get("sales_price"))
+                or _is_bad_number(color.get("subtotal"))
+            ):
+                return False
+            
+            sizes = color.get("sizes")
+            if not isinstance(sizes, list):
+                continue
+            
+            # Quantidades têm de estar já normalizadas (inteiros, ou floats
+            # não inteiros positivos e finitos)
+            for size in sizes:
+                if not isinstance(size, dict):
+                    return False
+                
+                quantity = size.get("quantity")
+                quantity_type = type(quantity)
+                if quantity_type is int:
+                    if quantity < 0:
+                        return False
+                    if quantity > 0:
+                        has_valid_items = True
+                elif (
+                    quantity_type is float
+                    and quantity > 0
+                    and _isfinite(quantity)
+                    and not quantity.is_integer()
+                ):
+                    has_valid_items = True
+                else:
+                    return False
+        
+        # Produtos sem itens válidos seriam removidos
+        if not has_valid_items:
+            return False
+    
+    return not _contains_bad(extraction_result)
+
+@lru_cache(maxsize=256)
+def _resolve_markup(supplier: str, default_markup: float) -> float:
+    """
+    Determina o markup de um fornecedor, com cache por fornecedor
+    
+    Args:
+        supplier: Nome do fornecedor
+        default_markup: Markup padrão se não for possível determinar pelo fornecedor
+        
+    Returns:
+        float: Markup do fornecedor ou o markup padrão
+    """
+    # Se não conseguir importar, usar markup padrão
+    if not has_reference_data:
+        return default_markup
+    
+    supplier_code = get_supplier_code(supplier)
+    if supplier_code:
+        supplier_markup = get_markup(supplier_code)
+        if supplier_markup:
+            return supplier_markup
+    
+    return default_markup
+
+# Padrão para identificar nomes de produtos (ex: Paddy 10241663 01)
+_PRODUCT_NAME_RE = re.compile(r'^([A-Za-z\s]+)(?:\s+\d+.*)?$')
+# Sequências de dígitos e espaços, tratadas numa única passagem
+_CLEAN_RE = re.compile(r'[\d\s]+')
+
+def _clean_sub(match: re.Match) -> str:
+    """
+    Remove dígitos e reduz a um espaço as sequências que contêm espaços
+    """
+    return '' if match.group().isdigit() else ' '
+
+@lru_cache(maxsize=4096)
+def _clean_product_name_cached(name: str) -> str:
+    """
+    Implementação em cache de ProcessingRecovery.clean_product_name.
+    Os catálogos repetem muito os mesmos nomes, e a limpeza é uma função
+    pura de string para string.
+    """
+    match = _PRODUCT_NAME_RE.match(name)
+    
+    if match:
+        # Extrair apenas o nome (ex: Paddy)
+        return match.group(1).strip()
+    
+    # Se não conseguir extrair com o padrão, remover todos os números e
+    # os espaços duplos que possam ficar, numa única passagem
+    return _CLEAN_RE.sub(_clean_sub, name).strip()
+
 class ProcessingRecovery:
     """
     Sistema de recuperação para processamento de documentos que lida com
@@ -15,36 +235,19 @@ class ProcessingRecovery:
     """
     
     @staticmethod
-    def sanitize_json_data(data: Any) -> Any:
+    def sanitize_json_data(data: Any, inplace: bool = False) -> Any:
         """
         Sanitiza dados para garantir que sejam compatíveis com JSON
         
         Args:
             data: Dados a serem sanitizados
+            inplace: Se True, altera os dados diretamente em vez de os copiar
+                (apenas para quem é dono do objeto)
             
         Returns:
             Any: Dados sanitizados
         """
-        if data is None:
-            return None
-            
-        # Processar dicionários recursivamente
-        if isinstance(data, dict):
-            return {k: ProcessingRecovery.sanitize_json_data(v) for k, v in data.items()}
-            
-        # Processar listas recursivamente
-        if isinstance(data, list):
-            return [ProcessingRecovery.sanitize_json_data(item) for item in data]
-            
-        # Tratar valores numéricos
-        if isinstance(data, (int, float)):
-            # Substituir NaN e infinito por None
-            if isinstance(data, float) and (math.isnan(data) or math.isinf(data)):
-                return None
-            return data
-            
-        # Retornar outros tipos sem modificação
-        return data
+        return _sanitize_with_flag(data, inplace)[0]
     
     @staticmethod
     def fix_product_prices(
@@ -63,77 +266,63 @@ class ProcessingRecovery:
         Returns:
             Dict: Produto com preços corrigidos
         """
-        try:
-            from app.data.reference_data import get_supplier_code, get_markup
-            
-            # Determinar markup
-            markup = default_markup
-            if supplier:
-                supplier_code = get_supplier_code(supplier)
-                if supplier_code:
-                    supplier_markup = get_markup(supplier_code)
-                    if supplier_markup:
-                        markup = supplier_markup
-        except ImportError:
-            # Se não conseguir importar, usar markup padrão
-            markup = default_markup
+        # Determinar markup
+        markup = _resolve_markup(supplier, default_markup) if supplier else default_markup
+        
+        # Soma dos subtotais, acumulada durante o processamento das cores
+        # apenas quando o total_price tiver de ser recalculado
+        needs_total = _is_bad_number(product.get("total_price"))
+        sum_subtotals = 0
         
         # Processar cada cor
         if "colors" in product and isinstance(product["colors"], list):
             for color in product["colors"]:
+                # Valores da cor em variáveis locais; o dicionário só é
+                # escrito quando um valor é corrigido
+                unit_price = color.get("unit_price")
+                sizes = color.get("sizes")
+                
                 # Verificar preço unitário
-                if "unit_price" not in color or color["unit_price"] is None or (
-                    isinstance(color["unit_price"], float) and (math.isnan(color["unit_price"]) or math.isinf(color["unit_price"]))
-                ):
+                if _is_bad_number(unit_price):
                     # Usar valor default
-                    color["unit_price"] = 0.0
+                    unit_price = color["unit_price"] = 0.0
                 
                 # Verificar preço de venda
-                if "sales_price" not in color or color["sales_price"] is None or (
-                    isinstance(color["sales_price"], float) and (math.isnan(color["sales_price"]) or math.isinf(color["sales_price"]))
-                ):
+                if _is_bad_number(color.get("sales_price")):
                     # Calcular baseado no preço unitário
-                    color["sales_price"] = round(color["unit_price"] * markup, 2)
+                    color["sales_price"] = round(unit_price * markup, 2)
                 
                 # Verificar tamanhos e calcular subtotal
                 total_quantity = 0
-                if "sizes" in color and isinstance(color["sizes"], list):
-                    for size in color["sizes"]:
-                        if "quantity" not in size or size["quantity"] is None or (
-                            isinstance(size["quantity"], float) and (math.isnan(size["quantity"]) or math.isinf(size["quantity"]))
-                        ):
+                if isinstance(sizes, list):
+                    for size in sizes:
+                        quantity = size.get("quantity")
+                        if _is_bad_number(quantity):
                             size["quantity"] = 0
                         else:
                             # Garantir que é um número inteiro positivo
                             try:
-                                qty = float(size["quantity"])
+                                qty = float(quantity)
                                 if qty > 0:
-                                    size["quantity"] = int(qty) if qty.is_integer() else qty
-                                    total_quantity += size["quantity"]
+                                    quantity = int(qty) if qty.is_integer() else qty
+                                    size["quantity"] = quantity
+                                    total_quantity += quantity
                                 else:
                                     size["quantity"] = 0
                             except (ValueError, TypeError):
                                 size["quantity"] = 0
                 
                 # Recalcular subtotal baseado nas quantidades
-                if "subtotal" not in color or color["subtotal"] is None or (
-                    isinstance(color["subtotal"], float) and (math.isnan(color["subtotal"]) or math.isinf(color["subtotal"]))
-                ):
-                    color["subtotal"] = round(color["unit_price"] * total_quantity, 2)
+                subtotal = color.get("subtotal")
+                if _is_bad_number(subtotal):
+                    subtotal = color["subtotal"] = round(unit_price * total_quantity, 2)
+                
+                if needs_total:
+                    sum_subtotals += subtotal
         
         # Recalcular total_price
-        if "total_price" not in product or product["total_price"] is None or (
-            isinstance(product["total_price"], float) and (math.isnan(product["total_price"]) or math.isinf(product["total_price"]))
-        ):
-            subtotals = [
-                color.get("subtotal", 0) 
-                for color in product.get("colors", []) 
-                if color.get("subtotal") is not None and not (
-                    isinstance(color.get("subtotal"), float) and 
-                    (math.isnan(color.get("subtotal")) or math.isinf(color.get("subtotal")))
-                )
-            ]
-            product["total_price"] = sum(subtotals)
+        if needs_total:
+            product["total_price"] = sum_subtotals
         
         return product
     
@@ -150,22 +339,8 @@ class ProcessingRecovery:
         """
         if not name:
             return ""
-            
-        # Padrão para identificar nomes de produtos (ex: Paddy 10241663 01)
-        pattern = r'^([A-Za-z\s]+)(?:\s+\d+.*)?$'
-        match = re.match(pattern, name)
-        
-        if match:
-            # Extrair apenas o nome (ex: Paddy)
-            return match.group(1).strip()
-        
-        # Se não conseguir extrair com o padrão, remover todos os números
-        cleaned = re.sub(r'\d+', '', name).strip()
         
-        # Remover espaços duplos que podem ter ficado
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-        
-        return cleaned
+        return _clean_product_name_cached(name)
     
     @staticmethod
     def format_product_description(product_name: str, color_code: str, size: str) -> str:
@@ -213,6 +388,10 @@ class ProcessingRecovery:
         if "order_info" not in extraction_result:
             extraction_result["order_info"] = {}
         
+        # Resultado já válido: nada a corrigir
+        if _is_result_clean(extraction_result):
+            return extraction_result
+        
         # Obter informações do contexto
         order_info = extraction_result.get("order_info", {})
         if not supplier:
@@ -250,7 +429,7 @@ class ProcessingRecovery:
         extraction_result["products"] = fixed_products
         
         # Sanitizar o resultado final
-        sanitized_result = ProcessingRecovery.sanitize_json_data(extraction_result)
+        sanitized_result = ProcessingRecovery.sanitize_json_data(extraction_result, inplace=True)
         
         return sanitized_result
     
@@ -274,8 +453,7 @@ class ProcessingRecovery:
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             
             # Salvar o arquivo
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(sanitized_data, f, indent=2, ensure_ascii=False)
+            write_json_file(sanitized_data, file_path, indent=2, ensure_ascii=False)
             
             return True
         except Exception as e:
@@ -322,10 +500,10 @@ class ProcessingRecovery:
                 result = process_func(**kwargs)
                 
                 # Se chegou aqui, funcionou - verificar se há valores NaN
-                sanitized_result = ProcessingRecovery.sanitize_json_data(result)
+                sanitized_result, was_dirty = _sanitize_with_flag(result, inplace=True)
                 
                 # Verificar se a sanitização modificou o resultado
-                if sanitized_result != result:
+                if was_dirty:
                     logger.warning(f"Resultado sanitizado para remover valores NaN (tentativa {retries+1})")
                     
                     # Se for a primeira tentativa, tentar novamente com o resultado sanitizado
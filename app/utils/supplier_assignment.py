@@ -2,10 +2,20 @@
 import logging
 from typing import Dict, Any, List, Optional, Tuple
 from app.utils.supplier_utils import match_supplier_name, get_supplier_info
-from app.data.reference_data import SUPPLIER_MAP, get_supplier_code, get_markup
+from app.data.reference_data import SUPPLIER_NAMES, get_supplier_code, get_markup
 
 logger = logging.getLogger(__name__)
 
+# Pontuação de um candidato encontrado no reference_data, por
+# (match exato, veio do supplier do contexto): 1.0 para match exato, 0.8
+# para match aproximado, mais 0.1 de preferência ao supplier sobre a marca
+_SCORE_LUT: Dict[Tuple[bool, bool], float] = {
+    (True, True): 1.0 + 0.1,
+    (True, False): 1.0,
+    (False, True): 0.8 + 0.1,
+    (False, False): 0.8,
+}
+
 def determine_best_supplier(context_info: Dict[str, Any]) -> Tuple[str, Optional[str], Optional[float]]:
     supplier_from_context = context_info.get("supplier", "")
     brand_from_context = context_info.get("brand", "")
@@ -28,6 +38,20 @@ def determine_best_supplier(context_info: Dict[str, Any]) -> Tuple[str, Optional
         logger.warning("Nenhum candidato a fornecedor encontrado no contexto")
         return "Fornecedor não identificado", None, None
     
+    # Caso mais comum: um único candidato, sem arbitragem entre supplier e marca
+    if len(candidates) == 1:
+        source, candidate = candidates[0]
+        matched_supplier = match_supplier_name(candidate)
+        supplier_code = get_supplier_code(matched_supplier)
+        
+        if supplier_code and matched_supplier in SUPPLIER_NAMES:
+            markup = get_markup(supplier_code)
+            logger.info(f"Fornecedor final determinado: '{matched_supplier}' (código: {supplier_code}, markup: {markup}) - fonte: {source}")
+            return matched_supplier, supplier_code, markup or 2.73
+        
+        logger.warning(f"Nenhum fornecedor encontrado no reference_data, usando: '{candidate}'")
+        return candidate, None, 2.73
+    
     # 3. Avaliar cada candidato usando as funções existentes
     best_match = None
     best_supplier_code = None
@@ -41,18 +65,10 @@ def determine_best_supplier(context_info: Dict[str, Any]) -> Tuple[str, Optional
         # Verificar se o match resultou em um fornecedor conhecido
         supplier_code = get_supplier_code(matched_supplier)
         
-        if supplier_code and matched_supplier in SUPPLIER_MAP.values():
-            # Calcular score baseado na qualidade do match
-            if matched_supplier == candidate:
-                score = 1.0  # Match exato
-            elif matched_supplier in SUPPLIER_MAP.values():
-                score = 0.8  # Match encontrado no reference_data
-            else:
-                score = 0.3  # Match fraco
-            
-            # Dar preferência ao supplier do contexto sobre a marca
-            if source == "supplier_context":
-                score += 0.1
+        if supplier_code and matched_supplier in SUPPLIER_NAMES:
+            # Calcular score baseado na qualidade do match, dando preferência
+            # ao supplier do contexto sobre a marca
+            score = _SCORE_LUT[(matched_supplier == candidate, source == "supplier_context")]
             
             if score > best_score:
                 best_match = matched_supplier
@@ -60,9 +76,9 @@ def determine_best_supplier(context_info: Dict[str, Any]) -> Tuple[str, Optional
                 best_score = score
                 best_source = source
                 
-            logger.info(f"Candidato '{candidate}' ({source}) -> '{matched_supplier}' (score: {score:.2f})")
+            logger.info("Candidato '%s' (%s) -> '%s' (score: %.2f)", candidate, source, matched_supplier, score)
         else:
-            logger.info(f"Candidato '{candidate}' ({source}) -> '{matched_supplier}' (não encontrado no reference_data)")
+            logger.info("Candidato '%s' (%s) -> '%s' (não encontrado no reference_data)", candidate, source, matched_supplier)
     
     # 4. Determinar o fornecedor final
     if best_match:
@@ -91,20 +107,24 @@ def assign_supplier_to_products(products: List[Dict[str, Any]],
     for product in products:
         product["supplier"] = supplier_name
 
-        for color in product.get("colors", []):
+        for color in product.get("colors", ()):
             color["supplier"] = supplier_name
             
-            if not color.get("sales_price") and color.get("unit_price"):
-                color["sales_price"] = round(color.get("unit_price", 0) * markup, 2)
-                
-            if color.get("unit_price") and color.get("sizes"):
-                total_quantity = sum(size.get("quantity", 0) for size in color["sizes"])
+            # Ler os valores da cor uma única vez
+            unit_price = color.get("unit_price")
+            
+            if not color.get("sales_price") and unit_price:
+                color["sales_price"] = round(unit_price * markup, 2)
+            
+            sizes = color.get("sizes")
+            if unit_price and sizes:
+                total_quantity = sum(size.get("quantity", 0) for size in sizes)
                 if not color.get("subtotal") and total_quantity > 0:
-                    color["subtotal"] = round(color["unit_price"] * total_quantity, 2)
+                    color["subtotal"] = round(unit_price * total_quantity, 2)
+    
+        for reference in product.get("references", ()):
+            reference["supplier"] = supplier_name
     
-        for reference in product.get("references", []):
-                reference["supplier"] = supplier_name
-        
     logger.info(f"Fornecedor atribuído com sucesso a todos os produtos")
     return products
 
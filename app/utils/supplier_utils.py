@@ -1,12 +1,39 @@
 # app/utils/supplier_utils.py
 import logging
 import re
+from functools import lru_cache
 from difflib import SequenceMatcher
-from typing import Optional, List, Dict, Any, Tuple
-from app.data.reference_data import SUPPLIER_MAP, SUPPLIER_DATA, get_supplier_code
+from typing import Optional, List, Dict, Any, Tuple, FrozenSet, AbstractSet
+from app.data.reference_data import SUPPLIER_MAP, SUPPLIER_DATA, SUPPLIER_NAMES, get_supplier_code
 
 logger = logging.getLogger(__name__)
 
+try:
+    import numpy as np
+    from rapidfuzz import fuzz, process
+    has_rapidfuzz = True
+except ImportError:
+    has_rapidfuzz = False
+
+# Sufixos comuns de empresas, numa única alternância pela ordem original
+_SUFFIX_RE = re.compile(
+    r'\b(?:S\.p\.A\.?|S\.A\.?|S\.L\.?|Ltd\.?|Ltda\.?|Inc\.?|LLC\.?|GmbH\.?'
+    r'|Co\.?|Corp\.?|B\.V\.?|A\.G\.?)\b',
+    re.IGNORECASE
+)
+_PUNCT_RE = re.compile(r'[^\w\s]')
+
+# Sufixos de _SUFFIX_RE que não exigem pontos, i.e. que podem aparecer como
+# palavra num nome só com letras, dígitos e espaços
+_SUFFIX_WORDS = frozenset({"LTD", "LTDA", "INC", "LLC", "GMBH", "CO", "CORP"})
+
+# Tabela de tradução com os caracteres ASCII que _PUNCT_RE substitui por
+# espaço (derivada da própria regex, para manter o mesmo conjunto)
+_PUNCT_TABLE = str.maketrans({
+    char: ' ' for char in map(chr, range(128)) if _PUNCT_RE.match(char)
+})
+
+@lru_cache(maxsize=4096)
 def normalize_supplier_name(name: str) -> str:
     """
     Normaliza o nome do fornecedor para comparação, removendo sufixos de empresas e caracteres especiais.
@@ -20,27 +47,101 @@ def normalize_supplier_name(name: str) -> str:
     if not name:
         return ""
     
+    # Nome já normalizado (maiúsculas ASCII, só letras, dígitos e espaços
+    # simples, sem sufixos de empresas): devolver sem alterações
+    if (name.isascii() and name.isupper() and name.replace(' ', '').isalnum()
+            and '  ' not in name and name[0] != ' ' and name[-1] != ' '
+            and _SUFFIX_WORDS.isdisjoint(name.split())):
+        return name
+    
     # Converter para maiúsculas
     result = name.upper()
     
     # Remover sufixos comuns de empresas
-    suffixes = [
-        r'\bS\.p\.A\.?\b', r'\bS\.A\.?\b', r'\bS\.L\.?\b', r'\bLtd\.?\b', 
-        r'\bLtda\.?\b', r'\bInc\.?\b', r'\bLLC\.?\b', r'\bGmbH\.?\b',
-        r'\bCo\.?\b', r'\bCorp\.?\b', r'\bB\.V\.?\b', r'\bA\.G\.?\b'
-    ]
-    
-    for suffix in suffixes:
-        result = re.sub(suffix, '', result, flags=re.IGNORECASE)
+    result = _SUFFIX_RE.sub('', result)
     
-    # Remover caracteres especiais e converter para espaço
-    result = re.sub(r'[^\w\s]', ' ', result)
+    # Remover caracteres especiais e converter para espaço; texto ASCII usa a
+    # tabela de tradução, o restante a regex (pontuação Unicode)
+    if result.isascii():
+        result = result.translate(_PUNCT_TABLE)
+    else:
+        result = _PUNCT_RE.sub(' ', result)
     
     # Remover espaços extras
-    result = re.sub(r'\s+', ' ', result).strip()
+    result = ' '.join(result.split())
     
     return result
 
+# Fornecedores conhecidos (dados estáticos), normalizados numa única passagem:
+# - tuplos (original, normalizado, conjunto de tokens, lista de tokens),
+#   excluindo os que ficam vazios após a normalização
+# - índice do nome normalizado para o primeiro fornecedor com esse nome
+# - apenas os nomes normalizados, pela mesma ordem (para pontuação em lote)
+# - índice invertido token -> posições (em _NORMALIZED_SUPPLIERS) dos
+#   fornecedores que contêm esse token, para contar os tokens em comum com
+#   todos os fornecedores numa única passagem pelos tokens da consulta
+_NORMALIZED_SUPPLIERS: List[Tuple[str, str, FrozenSet[str], List[str]]] = []
+_NORMALIZED_LOOKUP: Dict[str, str] = {}
+_NORMALIZED_NAMES: List[str] = []
+_TOKEN_POSTINGS: Dict[str, List[int]] = {}
+for _supplier in SUPPLIER_MAP.values():
+    _normalized = normalize_supplier_name(_supplier)
+    if _normalized:
+        _tokens = _normalized.split()
+        _token_set = frozenset(_tokens)
+        for _token in _token_set:
+            _TOKEN_POSTINGS.setdefault(_token, []).append(len(_NORMALIZED_SUPPLIERS))
+        _NORMALIZED_SUPPLIERS.append((_supplier, _normalized, _token_set, _tokens))
+        _NORMALIZED_LOOKUP.setdefault(_normalized, _supplier)
+        _NORMALIZED_NAMES.append(_normalized)
+
+# Índices inversos de SUPPLIER_DATA: nome -> primeiro código com esse nome,
+# e código -> informação pública do fornecedor
+_NAME_TO_CODE: Dict[str, str] = {}
+for _code, _data in SUPPLIER_DATA.items():
+    _NAME_TO_CODE.setdefault(_data["nome"], _code)
+
+_CODE_TO_INFO: Dict[str, Dict[str, Any]] = {
+    code: {"code": code, "name": data["nome"], "markup": data["marcacao"]}
+    for code, data in SUPPLIER_DATA.items()
+}
+
+# Trie (dicionários aninhados, um nível por carácter) sobre os tokens dos
+# fornecedores; cada nó guarda em "" as posições, por ordem crescente, dos
+# fornecedores com algum token que começa por esse prefixo
+_PREFIX_TRIE: Dict[str, Any] = {}
+for _index, (_, _, _token_set, _) in enumerate(_NORMALIZED_SUPPLIERS):
+    for _token in _token_set:
+        _node = _PREFIX_TRIE
+        for _char in _token:
+            _node = _node.setdefault(_char, {})
+            _indices = _node.setdefault("", [])
+            if not _indices or _indices[-1] != _index:
+                _indices.append(_index)
+
+# Número máximo de candidatos do trie avaliados antes dos restantes
+TRIE_SHORTLIST_SIZE = 8
+
+# Comprimento mínimo de um token para ser considerado muito específico
+LONG_TOKEN_LENGTH = 6
+
+def _prefix_candidates(prefix: str) -> List[int]:
+    """
+    Devolve as posições dos fornecedores com algum token que começa pelo prefixo.
+    
+    Args:
+        prefix: Prefixo (normalizado) a procurar
+        
+    Returns:
+        List[int]: Posições em _NORMALIZED_SUPPLIERS, por ordem crescente
+    """
+    node = _PREFIX_TRIE
+    for char in prefix:
+        node = node.get(char)
+        if node is None:
+            return []
+    return node.get("", [])
+
 def calculate_similarity_score(str1: str, str2: str) -> float:
     """
     Calcula uma pontuação de similaridade entre duas strings usando diferentes métricas.
@@ -49,31 +150,69 @@ def calculate_similarity_score(str1: str, str2: str) -> float:
         str1: Primeira string
         str2: Segunda string
         
+    Returns:
+        float: Pontuação de similaridade entre 0 e 1
+    """
+    return _similarity_with_precomputed(str1, set(str1.split()), str2, set(str2.split()))
+
+def _similarity_with_precomputed(
+    str1: str,
+    tokens1: AbstractSet[str],
+    str2: str,
+    tokens2: AbstractSet[str],
+    seq_similarity: Optional[float] = None,
+    common_count: Optional[int] = None,
+    shares_long_token: Optional[bool] = None
+) -> float:
+    """
+    Igual a calculate_similarity_score, mas recebe os conjuntos de tokens já
+    calculados (ex.: os dos fornecedores conhecidos, preparados na importação).
+    
+    Args:
+        str1: Primeira string
+        tokens1: Tokens da primeira string
+        str2: Segunda string
+        tokens2: Tokens da segunda string
+        seq_similarity: Similaridade de sequência já calculada (0 a 1), se existir
+        common_count: Número de tokens em comum já calculado, se existir
+        shares_long_token: Se já se sabe que há um token de 4+ caracteres em
+            comum (exige common_count)
+        
     Returns:
         float: Pontuação de similaridade entre 0 e 1
     """
     # Similaridade de sequência (considera ordem dos caracteres)
-    seq_similarity = SequenceMatcher(None, str1, str2).ratio()
+    if seq_similarity is None:
+        if has_rapidfuzz:
+            # fuzz.ratio (distância Indel normalizada) em C++, na escala 0-100
+            seq_similarity = fuzz.ratio(str1, str2) / 100.0
+        else:
+            seq_similarity = SequenceMatcher(None, str1, str2).ratio()
     
     # Similaridade de conjunto (tokens em comum)
-    tokens1 = set(str1.split())
-    tokens2 = set(str2.split())
+    if common_count is None:
+        common_tokens = tokens1 & tokens2 if tokens1 and tokens2 else ()
+        common_count = len(common_tokens)
+        shares_long_token = any(len(t) >= 4 for t in common_tokens)
     
     # Evitar divisão por zero
     if not tokens1 or not tokens2:
         set_similarity = 0
     else:
-        common_tokens = tokens1.intersection(tokens2)
-        set_similarity = len(common_tokens) / max(len(tokens1), len(tokens2))
-    
-    # Verificar se há tokens significativos em comum
-    significant_tokens = False
-    for t1 in tokens1:
-        if len(t1) >= 4:  # token com pelo menos 4 caracteres
-            for t2 in tokens2:
-                if t1 == t2 or (len(t1) >= 4 and t1 in t2) or (len(t2) >= 4 and t2 in t1):
-                    significant_tokens = True
-                    break
+        set_similarity = common_count / max(len(tokens1), len(tokens2))
+    
+    # Verificar se há tokens significativos (pelo menos 4 caracteres) em comum:
+    # primeiro por igualdade, usando a interseção já calculada, e só depois
+    # por inclusão de um token no outro
+    significant_tokens = shares_long_token
+    if not significant_tokens and tokens2:
+        long_tokens1 = [t1 for t1 in tokens1 if len(t1) >= 4]
+        if long_tokens1:
+            significant_tokens = any(
+                t1 in t2 or (len(t2) >= 4 and t2 in t1)
+                for t1 in long_tokens1
+                for t2 in tokens2
+            )
     
     # Ponderar as diferentes métricas
     token_bonus = 0.2 if significant_tokens else 0.0
@@ -81,54 +220,140 @@ def calculate_similarity_score(str1: str, str2: str) -> float:
     
     return min(final_score, 1.0)  # Garantir que não exceda 1.0
 
+@lru_cache(maxsize=1024)
 def find_most_similar_supplier(normalized_supplier: str) -> Tuple[Optional[str], float]:
     if not normalized_supplier:
         return None, 0.0
     
     # Verificar correspondência exata primeiro
-    for supplier in SUPPLIER_MAP.values():
-        if normalize_supplier_name(supplier) == normalized_supplier:
-            return supplier, 1.0
-    
-    # Preparar lista de fornecedores conhecidos
-    known_suppliers = list(SUPPLIER_MAP.values())
-    normalized_suppliers = [normalize_supplier_name(s) for s in known_suppliers]
+    exact_match = _NORMALIZED_LOOKUP.get(normalized_supplier)
+    if exact_match is not None:
+        return exact_match, 1.0
     
     # Calcular similaridade com cada fornecedor conhecido
     best_match = None
     best_score = 0.0
     
-    # Log para depuração
+    # Log para depuração (só recolhido se o nível DEBUG estiver ativo)
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
     all_scores = []
     
-    for i, supplier in enumerate(normalized_suppliers):
-        if not supplier:  # Pular fornecedores com nome vazio após normalização
-            continue
+    # Tokens da consulta, calculados uma única vez
+    query_token_list = normalized_supplier.split()
+    query_tokens = set(query_token_list)
+    query_len = len(normalized_supplier)
+    query_token_count = len(query_tokens)
+    
+    # Tokens em comum com cada fornecedor (e se algum tem 4+ caracteres),
+    # contados pelo índice invertido, e fornecedores com um token muito
+    # específico (LONG_TOKEN_LENGTH+ caracteres) igual a um da consulta
+    supplier_count = len(_NORMALIZED_SUPPLIERS)
+    common_counts = [0] * supplier_count
+    shares_long = [False] * supplier_count
+    long_token_hits = set()
+    for token in query_tokens:
+        postings = _TOKEN_POSTINGS.get(token)
+        if postings:
+            is_long = len(token) >= 4
+            for index in postings:
+                common_counts[index] += 1
+                if is_long:
+                    shares_long[index] = True
+            if len(token) >= LONG_TOKEN_LENGTH:
+                long_token_hits.update(postings)
+    
+    order = range(supplier_count)
+    if len(long_token_hits) == 1:
+        # Um único fornecedor partilha um token muito específico: avaliá-lo
+        # primeiro e dispensar a similaridade de sequência em lote. Os
+        # restantes só são avaliados (um a um) se o limite superior da sua
+        # pontuação, pelo comprimento, o puder igualar ou ultrapassar.
+        hit = next(iter(long_token_hits))
+        order = [hit] + [index for index in order if index != hit]
+        seq_scores = None
+    else:
+        # Similaridade de sequência contra todos os fornecedores numa única
+        # chamada nativa (process.cdist); sem rapidfuzz é calculada um a um
+        if has_rapidfuzz:
+            seq_scores = process.cdist(
+                [normalized_supplier], _NORMALIZED_NAMES,
+                scorer=fuzz.ratio, dtype=np.float64, workers=1
+            )[0].tolist()
+        else:
+            seq_scores = None
+        
+        # Avaliar primeiro os poucos fornecedores com um token que começa pelo
+        # token mais longo da consulta (4+ caracteres): um bom resultado logo no
+        # início permite que a poda abaixo salte a maioria dos restantes. Os
+        # empates resolvem-se pela posição original, pelo que o resultado não
+        # depende desta ordem.
+        longest_token = max(query_token_list, key=len)
+        if len(longest_token) >= 4:
+            shortlist = _prefix_candidates(longest_token)
+            if 0 < len(shortlist) <= TRIE_SHORTLIST_SIZE:
+                shortlisted = set(shortlist)
+                order = shortlist + [index for index in order if index not in shortlisted]
+    
+    best_index = -1
+    for index in order:
+        known_supplier, supplier, supplier_tokens, _ = _NORMALIZED_SUPPLIERS[index]
+        seq_score = seq_scores[index] if seq_scores is not None else None
+        
+        # Poda por disparidade de comprimento: com um melhor resultado de pelo
+        # menos 0.7 (o mínimo dado por um token em comum), saltar candidatos
+        # cujo limite superior de pontuação não o consegue ultrapassar. A
+        # similaridade de sequência nunca excede 2*min/(len1+len2) e a de
+        # conjunto nunca excede min/max do número de tokens; um token longo em
+        # comum garante pelo menos 0.7. Um limite igual ao melhor só é
+        # avaliado se o candidato vier antes dele (desempate pela posição).
+        if best_score >= 0.7:
+            if seq_score is not None:
+                seq_bound = seq_score / 100.0
+            else:
+                supplier_len = len(supplier)
+                seq_bound = 2.0 * min(query_len, supplier_len) / (query_len + supplier_len)
             
-        # Calcular pontuação de similaridade
-        score = calculate_similarity_score(normalized_supplier, supplier)
-        all_scores.append((known_suppliers[i], score))
+            token_count = len(supplier_tokens)
+            set_bound = min(query_token_count, token_count) / max(query_token_count, token_count)
+            
+            score_bound = (seq_bound * 0.4) + (set_bound * 0.4) + 0.2
+            if shares_long[index]:
+                score_bound = max(score_bound, 0.7)
+            if score_bound < best_score or (score_bound == best_score and index > best_index):
+                continue
+        
+        # Sem pontuação em lote, calcular a similaridade de sequência só para
+        # os candidatos que sobreviveram à poda
+        if seq_score is None and has_rapidfuzz:
+            seq_score = fuzz.ratio(normalized_supplier, supplier)
         
-        # Verificar token-a-token também
-        tokens1 = normalized_supplier.split()
-        tokens2 = supplier.split()
+        # Calcular pontuação de similaridade
+        score = _similarity_with_precomputed(
+            normalized_supplier, query_tokens, supplier, supplier_tokens,
+            seq_score / 100.0 if seq_score is not None else None,
+            common_counts[index], shares_long[index]
+        )
+        if debug_enabled:
+            all_scores.append((known_supplier, score))
         
         # Verificar se há um token muito específico em comum
-        for token in tokens1:
-            if len(token) >= 4 and token in tokens2:
-                score = max(score, 0.7)  # Aumentar pontuação se há um token significativo em comum
+        if shares_long[index]:
+            score = max(score, 0.7)  # Aumentar pontuação se há um token significativo em comum
         
-        if score > best_score:
+        if score > best_score or (score == best_score and best_match is not None and index < best_index):
             best_score = score
-            best_match = known_suppliers[i]
+            best_match = known_supplier
+            best_index = index
     
     # Registrar todos os scores para depuração
-    sorted_scores = sorted(all_scores, key=lambda x: x[1], reverse=True)
-    log_scores = sorted_scores[:3]  # mostrar apenas os 3 melhores para evitar log muito grande
-    logger.debug(f"Top 3 correspondências para '{normalized_supplier}': {log_scores}")
+    if debug_enabled:
+        sorted_scores = sorted(all_scores, key=lambda x: x[1], reverse=True)
+        log_scores = sorted_scores[:3]  # mostrar apenas os 3 melhores para evitar log muito grande
+        logger.debug("Top 3 correspondências para '%s': %s", normalized_supplier, log_scores)
     
     return best_match, best_score
 
+@lru_cache(maxsize=1024)
 def match_supplier_name(extracted_supplier: str) -> str:
     if not extracted_supplier or extracted_supplier.strip() == "":
         logger.warning("Nome de fornecedor vazio fornecido para correspondência")
@@ -136,7 +361,7 @@ def match_supplier_name(extracted_supplier: str) -> str:
     
     try:
         # Verificar correspondência exata primeiro
-        if extracted_supplier in SUPPLIER_MAP.values():
+        if extracted_supplier in SUPPLIER_NAMES:
             return extracted_supplier
         
         # Normalizar o fornecedor extraído
@@ -161,15 +386,11 @@ def match_supplier_name(extracted_supplier: str) -> str:
         logger.exception(f"Erro ao tentar corresponder fornecedor '{extracted_supplier}': {str(e)}")
         return extracted_supplier
 
-def get_normalized_supplier(supplier_name: str) -> tuple[str, Optional[str]]:  
+@lru_cache(maxsize=512)
+def get_normalized_supplier(supplier_name: str) -> tuple[str, Optional[str]]:
     normalized_name = match_supplier_name(supplier_name)
     
-    supplier_code = None
-    
-    for code, data in SUPPLIER_DATA.items():
-        if data["nome"] == normalized_name:
-            supplier_code = code
-            break
+    supplier_code = _NAME_TO_CODE.get(normalized_name)
     
     if not supplier_code:
         supplier_code = get_supplier_code(normalized_name)
@@ -177,24 +398,16 @@ def get_normalized_supplier(supplier_name: str) -> tuple[str, Optional[str]]:
     return normalized_name, supplier_code
 
 def get_supplier_info(supplier_name_or_code: str) -> Dict[str, Any]:
-    if supplier_name_or_code in SUPPLIER_DATA:
-        return {
-            "code": supplier_name_or_code,
-            "name": SUPPLIER_DATA[supplier_name_or_code]["nome"],
-            "markup": SUPPLIER_DATA[supplier_name_or_code]["marcacao"]
-        }
+    if supplier_name_or_code in _CODE_TO_INFO:
+        return dict(_CODE_TO_INFO[supplier_name_or_code])
     
     
     # Se for um nome, primeiro normalizar
     normalized_name = match_supplier_name(supplier_name_or_code)
     
     # Buscar o código
-    for code, data in SUPPLIER_DATA.items():
-        if data["nome"] == normalized_name:
-            return {
-                "code": code,
-                "name": data["nome"],
-                "markup": data["marcacao"]
-            }
-    
-    return {}
\ No newline at end of file
+    code = _NAME_TO_CODE.get(normalized_name)
+    if code is not None:
+        return dict(_CODE_TO_INFO[code])
+    
+    return {}